@@ -0,0 +1,261 @@
+import numpy as np
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import uuid
+
+# Features derived from survey images (color statistics, SVM histograms,
+# network embeddings) are stored per collection, feature type and
+# parameters, so that notebooks working on the same images only decode
+# each image once. Rows are appended in chunks of memory-mapped .npy
+# files, and an index file maps each image id to its row.
+# SUAVE_FEATURE_STORE overrides the default location.
+STORE_DIR = os.environ.get('SUAVE_FEATURE_STORE', '../../temp_csvs/feature_store/')
+
+# Chunks a store may have before its rows are compacted into one
+MAX_CHUNKS = 64
+
+
+class FeatureStore:
+    """
+    FeatureStore keeps the feature vectors of the images of a
+    collection, for one feature type and set of parameters.
+
+    Rows can carry a signature (e.g. the size and modification time
+    of the image file, see file_signature), and are recomputed when it
+    changes. Rows with NaN values (images that could not be read) are
+    not stored.
+
+    Several stores (e.g. notebooks running at the same time) can write
+    to the same collection: writes hold a file lock and merge into the
+    index on disk, and chunks have unique names. Recomputed rows leave
+    their old rows behind in earlier chunks; these are dropped when
+    the store is compacted, which get does once they outnumber the
+    live rows or once there are more than MAX_CHUNKS chunks. The
+    index is rewritten on every put, so rows are best stored in
+    batches of hundreds rather than one by one.
+
+    :param collection: string identifying the image collection,
+                       e.g. the path of its images folder
+    :param feature: string, name of the feature type
+    :param params: dictionary of the parameters of the features
+                   (JSON serializable)
+    :param root: string representing path to the store
+    :param dtype: string, NumPy type the rows are stored as
+    """
+
+    def __init__(self, collection, feature, params=None, root=None, dtype='float32'):
+        self.collection = collection
+        self.feature = feature
+        self.params = params or {}
+        self.dtype = np.dtype(dtype)
+        key = json.dumps([collection, feature, self.params, self.dtype.str], sort_keys=True)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(root or STORE_DIR, feature + '_' + digest)
+        self.index_path = os.path.join(self.path, 'index.json')
+        self.index = self.read_index()
+
+    def read_index(self):
+        """
+        :returns: dictionary with the row width, the number of rows
+                  of each chunk and, for each id, its chunk, row and
+                  signature
+        """
+
+        if not os.path.exists(self.index_path):
+            return {'collection': self.collection, 'feature': self.feature,
+                    'params': self.params, 'width': None, 'chunks': {}, 'rows': {}}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def write_index(self):
+        partial_file = self.index_path + '.' + str(os.getpid()) + '.tmp'
+        with open(partial_file, 'w') as f:
+            json.dump(self.index, f)
+        # Renaming keeps readers from seeing a partial index
+        os.replace(partial_file, self.index_path)
+
+    def chunk_path(self, chunk):
+        return os.path.join(self.path, 'rows_' + chunk + '.npy')
+
+    @contextlib.contextmanager
+    def locked(self, shared=False):
+        """Holds the lock of the store, shared to read or exclusive to write."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def missing(self, ids, signatures=None):
+        """
+        :param ids: list of image ids
+        :param signatures: dictionary of id to signature
+        :returns: list of the ids without an up to date row
+        """
+
+        rows = self.index['rows']
+        missing = []
+        for i in dict.fromkeys(ids):
+            entry = rows.get(i)
+            if (entry is None) or ((signatures is not None) and
+                                   (entry[2] != plain(signatures.get(i)))):
+                missing.append(i)
+        return missing
+
+    def put(self, ids, values, signatures=None):
+        """
+        put appends the rows of ids as a new chunk, and adds them to
+        the index as it is on disk.
+
+        :param ids: list of image ids
+        :param values: array of shape (len(ids), width)
+        :param signatures: dictionary of id to signature
+        """
+
+        values = np.asarray(values, dtype=self.dtype)
+        keep = ~np.isnan(values).any(axis=1)
+        ids = [i for i, kept in zip(ids, keep) if kept]
+        values = values[keep]
+        if not ids:
+            return
+
+        with self.locked():
+            # Other stores may have written since this one read the index
+            self.index = self.read_index()
+            if self.index['width'] is None:
+                self.index['width'] = values.shape[1]
+            elif self.index['width'] != values.shape[1]:
+                raise ValueError('Rows of ' + str(values.shape[1]) +
+                                 ' values stored with rows of ' + str(self.index['width']))
+
+            # Unique names, so that stores writing at once never share a chunk
+            chunk = uuid.uuid4().hex
+            np.save(self.chunk_path(chunk), values)
+            self.index['chunks'][chunk] = len(ids)
+            for row, i in enumerate(ids):
+                signature = plain(signatures.get(i)) if signatures is not None else None
+                self.index['rows'][i] = [chunk, row, signature]
+            self.write_index()
+
+    def read(self, ids):
+        """
+        read gathers the stored rows of ids. Ids without a row
+        are NaN.
+
+        :param ids: list of image ids
+        :returns: array of shape (len(ids), width)
+        """
+
+        if not os.path.exists(self.index_path):
+            return np.full((len(ids), self.index['width'] or 0), np.nan, dtype=self.dtype)
+
+        with self.locked(shared=True):
+            self.index = self.read_index()
+            matrix = np.full((len(ids), self.index['width'] or 0), np.nan, dtype=self.dtype)
+            return self.gather(ids, matrix)
+
+    def gather(self, ids, matrix):
+        """Copies the stored rows of ids into matrix (the caller holds the lock)."""
+        rows = self.index['rows']
+        positions = {}
+        for position, i in enumerate(ids):
+            if i in rows:
+                chunk, row, _ = rows[i]
+                positions.setdefault(chunk, ([], []))
+                positions[chunk][0].append(position)
+                positions[chunk][1].append(row)
+
+        # Only the rows needed are read from each chunk
+        for chunk, (targets, chunk_rows) in positions.items():
+            values = np.load(self.chunk_path(chunk), mmap_mode='r')
+            matrix[targets] = values[chunk_rows]
+        return matrix
+
+    def compact(self):
+        """
+        compact rewrites the live rows of the store into one chunk and
+        removes the other chunks, with the rows left behind by
+        recomputed ones.
+        """
+
+        with self.locked():
+            self.index = self.read_index()
+            ids = list(self.index['rows'])
+            old_chunks = list(self.index['chunks'])
+            if len(old_chunks) < 2 and sum(self.index['chunks'].values()) == len(ids):
+                return
+
+            # Rows are copied chunk by chunk into the new file, not held in memory
+            chunk = uuid.uuid4().hex
+            matrix = np.lib.format.open_memmap(self.chunk_path(chunk), mode='w+',
+                                               dtype=self.dtype,
+                                               shape=(len(ids), self.index['width'] or 0))
+            self.gather(ids, matrix)
+            matrix.flush()
+            del matrix
+
+            self.index['chunks'] = {chunk: len(ids)}
+            self.index['rows'] = {i: [chunk, row, self.index['rows'][i][2]]
+                                  for row, i in enumerate(ids)}
+            self.write_index()
+            for old_chunk in old_chunks:
+                os.remove(self.chunk_path(old_chunk))
+
+    def get(self, ids, compute, signatures=None, batch_size=1000):
+        """
+        get returns the feature matrix of ids, computing and storing
+        the rows that are missing or out of date, batch_size at a time
+        so that an interrupted run keeps what it computed.
+
+        :param ids: list of image ids
+        :param compute: function of a list of ids returning an array
+                        with their rows (NaN rows for failures)
+        :param signatures: dictionary of id to signature
+        :param batch_size: integer, rows computed and stored at a time
+        :returns: array of shape (len(ids), width)
+        """
+
+        ids = list(ids)
+        self.index = self.read_index()
+        missing = self.missing(ids, signatures)
+        computed = {}
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start+batch_size]
+            values = np.asarray(compute(batch), dtype=self.dtype)
+            self.put(batch, values, signatures)
+            # Failed rows are returned as computed but not stored
+            computed.update(zip(batch, values))
+
+        if missing:
+            stored = sum(self.index['chunks'].values())
+            if (stored > 2 * len(self.index['rows'])) or (len(self.index['chunks']) > MAX_CHUNKS):
+                self.compact()
+
+        matrix = self.read(ids)
+        if computed:
+            if matrix.shape[1] == 0:
+                width = len(next(iter(computed.values())))
+                matrix = np.full((len(ids), width), np.nan, dtype=self.dtype)
+            for position, i in enumerate(ids):
+                if i in computed:
+                    matrix[position] = computed[i]
+        return matrix
+
+
+def file_signature(path):
+    """Size and modification time of a file, None when it cannot be found."""
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return [status.st_size, status.st_mtime_ns]
+
+
+def plain(signature):
+    """Signature as it reads back from the index (tuples become lists)."""
+    return list(signature) if isinstance(signature, tuple) else signature
@@ -1,55 +1,314 @@
 import pandas as pd
+import numpy as np
 import panel as pn
-def slider(data):
+import hashlib
+import os
+import time
+
+# Parsed survey files are cached in a columnar format so that notebooks
+# chained on the same survey only parse the file once. By default the
+# cache lives in a .survey_cache folder next to the survey file (temp_csvs/),
+# SUAVE_CACHE_DIR overrides it.
+CACHE_DIR = os.environ.get('SUAVE_CACHE_DIR')
+CACHE_MAX_BYTES = 2 * 1024**3
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Survey files larger than this are read in chunks (see SurveyChunks) by
+# the notebooks that support it, rather than whole. SUAVE_STREAM_MIN_BYTES
+# overrides it.
+STREAM_MIN_BYTES = int(os.environ.get('SUAVE_STREAM_MIN_BYTES', 512 * 1024**2))
+
+
+def slider(data, viewer=None):
     """
     slider creates an interactive display of a
-    data frame.
+    data frame. Only the page of rows on display
+    is sent to the browser (see DataViewer).
     
-    :param df: data frame
+    :param data: data frame
+    :param viewer: DataViewer to show the data frame in, 
+                   reusing its widgets (defaults to a new one)
     :returns: interactive dataframe
     """
     
-    ## Row Selector widget
-    row_selection = pn.widgets.IntSlider(name='Navigate Rows', width=350, 
-                                         margin=(0,50,-15,0), end=len(data)-1)
+    if viewer is None:
+        viewer = DataViewer(data)
+    else:
+        viewer.update(data)
 
-    # Column Selector widget
-    col_selection = pn.widgets.IntSlider(name='Navigate Columns', width=350, 
-                                         margin=(0,0,5,0), end=len(data.columns))
-    
-    @pn.depends(row_selection, col_selection)
-    def navigate_data(row, col):
-        return data.iloc[row:row+5, col:col+7]
-    
+    return viewer.panel
 
-    return pn.Column(pn.Row(row_selection, col_selection), pn.panel(navigate_data, width=800), width=800).servable()
 
+class DataViewer:
+    """
+    DataViewer displays a data frame in a table paged
+    on the server (Tabulator with remote pagination), 
+    so that only the rows of the page on display are
+    serialized, however large the data frame is.
+    
+    A viewer is meant to be created once per display 
+    and reused: update() swaps its data in place rather
+    than building new widgets.
+    
+    :param data: data frame
+    :param page_size: integer, number of rows per page
+    :param width: integer, width of the table in pixels
+    """
+    
+    def __init__(self, data=None, page_size=10, width=800):
+        self.table = pn.widgets.Tabulator(pd.DataFrame() if data is None else data,
+                                          pagination='remote', page_size=page_size,
+                                          disabled=True, width=width)
+        self.panel = pn.Column(self.table, width=width).servable()
+        
+    def update(self, data):
+        """
+        update displays another data frame, or the same
+        data frame after it was modified in place.
+        
+        :param data: data frame
+        """
+        
+        if data is self.table.value:
+            self.table.param.trigger('value')
+        else:
+            self.table.value = data
 
 
-def extract_data(path):
+def extract_data(path, use_cache=True, cache_dir=None):
     """
     extract_data reads files from various formats
     
     :param link: string representing path to file
+    :param use_cache: bool whether to read from/write to the survey cache
+    :param cache_dir: string overriding the cache directory
     :returns: data frame of file
     """
 
+    if not path.endswith(('.txt', 'tsv', '.csv')):
+        return None
+
+    if use_cache:
+        cache_dir = cache_dir or CACHE_DIR or os.path.join(os.path.dirname(path), '.survey_cache')
+        key = file_hash(path)
+        cached_data = read_cache(cache_dir, key)
+        if cached_data is not None:
+            return cached_data
+
     # Reading file at path
     if path.endswith(('.txt', 'tsv')):
         try:
             data = pd.read_csv(path, sep='\t', encoding="latin-1")
         except UnicodeDecodeError:
             data = pd.read_csv(path, sep='\t', encoding="ISO-8859-1")
-    elif path.endswith('.csv'):
+    else:
         try:
             data = pd.read_csv(path, encoding="latin-1")
         except UnicodeDecodeError:
             data = pd.read_csv(path, encoding="ISO-8859-1")
-    else:
-        return None
     
     cleaned_data = (data
                     .dropna(axis=1, how='all')
                     .dropna(axis=0, how='all'))
+
+    if use_cache:
+        write_cache(cache_dir, key, cleaned_data)
     
     return cleaned_data
+
+
+def file_hash(path):
+    """
+    file_hash computes a digest of a file's contents, used
+    as the key of the survey cache.
+    
+    :param path: string representing path to file
+    :returns: hex digest of the file
+    """
+    
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_cache(cache_dir, key):
+    """
+    read_cache returns the cached data frame stored under key,
+    or None if there is none.
+    
+    :param cache_dir: string representing the cache directory
+    :param key: string, digest of the survey file
+    :returns: data frame or None
+    """
+    
+    for ext, reader in [('.parquet', pd.read_parquet), ('.pkl', pd.read_pickle)]:
+        cache_file = os.path.join(cache_dir, key + ext)
+        if not os.path.exists(cache_file):
+            continue
+        try:
+            data = reader(cache_file)
+        except Exception:
+            # Unreadable entries (e.g. interrupted writes) are reparsed
+            os.remove(cache_file)
+            return None
+        # Marks entry as recently used for eviction
+        os.utime(cache_file)
+        if ext == '.parquet':
+            # Parquet returns missing strings as None, read_csv as NaN
+            obj_cols = data.columns[data.dtypes == object]
+            data[obj_cols] = data[obj_cols].where(data[obj_cols].notna(), np.nan)
+        return data
+    return None
+
+
+def write_cache(cache_dir, key, data):
+    """
+    write_cache stores a cleaned data frame in the survey cache as
+    Parquet, falling back to pickle when the columns cannot be stored
+    as Parquet (mixed types, or no pyarrow), then evicts old entries.
+    
+    :param cache_dir: string representing the cache directory
+    :param key: string, digest of the survey file
+    :param data: data frame to store
+    """
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, key + '.parquet')
+    partial_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+    try:
+        data.to_parquet(partial_file)
+    except Exception:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        cache_file = os.path.join(cache_dir, key + '.pkl')
+        partial_file = cache_file + '.' + str(os.getpid()) + '.tmp'
+        data.to_pickle(partial_file, compression=None)
+    # Renaming keeps concurrent readers from seeing a partial file
+    os.replace(partial_file, cache_file)
+    
+    evict_cache(cache_dir)
+
+
+def evict_cache(cache_dir, max_bytes=None, max_age=None):
+    """
+    evict_cache removes cache entries not used within max_age
+    seconds, then the least recently used entries until the 
+    cache is smaller than max_bytes.
+    
+    :param cache_dir: string representing the cache directory
+    :param max_bytes: int, maximum size of the cache
+    :param max_age: int, maximum age of an entry in seconds
+    """
+    
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = CACHE_MAX_AGE if max_age is None else max_age
+    
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(('.parquet', '.pkl')):
+            continue
+        entry = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(entry)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    for used, size, entry in sorted(entries):
+        if (now - used <= max_age) and (total <= max_bytes):
+            break
+        try:
+            os.remove(entry)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def is_large(path):
+    """
+    :param path: string representing path to file
+    :returns: bool whether the file should be read in chunks
+    """
+    
+    return os.path.getsize(path) >= STREAM_MIN_BYTES
+
+
+class SurveyChunks:
+    """
+    SurveyChunks reads files too large for memory in chunks.
+    
+    The whole file is scanned once on creation to count the non-null 
+    values of every column, so that columns which are entirely NA are
+    dropped from every chunk, as extract_data would. The scan also fixes
+    the dtype of every column for the whole file (int64 or float64 when
+    all its values are numbers, strings otherwise), so that every chunk
+    has the same dtypes. Iterating yields cleaned data frames of at most
+    chunksize rows.
+    
+    :param path: string representing path to file
+    :param chunksize: integer, number of rows read at a time
+    :param dtype: dtype passed to read_csv (e.g. str), None to use the
+                  dtypes found by the scan
+    """
+    
+    def __init__(self, path, chunksize=100000, dtype=None):
+        if not path.endswith(('.txt', 'tsv', '.csv')):
+            raise ValueError('Unsupported file type: ' + path)
+        
+        self.path = path
+        self.chunksize = chunksize
+        self.dtype = dtype
+        self.sep = '\t' if path.endswith(('.txt', 'tsv')) else ','
+        
+        # Counts non-null values of every column across the whole file, and
+        # whether they are all integers/numbers (read as strings to check)
+        all_columns = pd.read_csv(path, sep=self.sep, encoding="latin-1", nrows=0).columns
+        non_null = np.zeros(len(all_columns), dtype=int)
+        integer = np.ones(len(all_columns), dtype=bool)
+        numeric = np.ones(len(all_columns), dtype=bool)
+        self.num_rows = 0
+        for chunk in self.read(dtype=str if dtype is None else dtype):
+            non_null += chunk.notna().sum().to_numpy()
+            self.num_rows += len(chunk)
+            if dtype is None:
+                for i, name in enumerate(chunk.columns):
+                    if not numeric[i]:
+                        continue
+                    values = chunk[name].dropna()
+                    numeric[i] = pd.to_numeric(values, errors='coerce').notna().all()
+                    if integer[i]:
+                        integer[i] = values.str.fullmatch(r'\s*[+-]?\d+\s*').all()
+        
+        if dtype is None:
+            # Columns with missing values cannot be int64, as in read_csv
+            integer &= non_null == self.num_rows
+            self.dtype = {name: ('int64' if integer[i] else 'float64' if numeric[i] else str)
+                          for i, name in enumerate(all_columns)}
+        
+        self.non_null = pd.Series(non_null, index=all_columns)
+        self.usecols = list(np.flatnonzero(non_null > 0))
+        self.columns = list(all_columns[self.usecols])
+        self.all_na = list(all_columns[non_null == 0])
+    
+    def read(self, usecols=None, dtype=None):
+        """
+        read iterates over the raw chunks of the file.
+        
+        :param usecols: list of column positions to read
+        :param dtype: dtype passed to read_csv, defaults to the dtypes
+                      of the file
+        :returns: iterator of data frames
+        """
+        return pd.read_csv(self.path, sep=self.sep, encoding="latin-1",
+                           dtype=self.dtype if dtype is None else dtype,
+                           usecols=usecols, chunksize=self.chunksize)
+    
+    def __iter__(self):
+        for chunk in self.read(self.usecols):
+            cleaned_chunk = chunk.dropna(axis=0, how='all')
+            if len(cleaned_chunk) > 0:
+                yield cleaned_chunk
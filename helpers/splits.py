@@ -0,0 +1,18 @@
+import numpy as np
+
+# Train/test splits shared by the image notebooks (predict, transfer_learning).
+# Splits are seeded, so they are the same on every run and for every model
+# trained on the same images.
+
+
+def split_indices(count, test_size=0.25, seed=0):
+    """
+    :param count: integer, number of samples
+    :param test_size: float, fraction of samples kept for testing
+    :param seed: integer, seed of the shuffle
+    :returns: arrays of the training and testing sample positions
+    """
+
+    order = np.random.RandomState(seed).permutation(count)
+    split = int(count * (1 - test_size))
+    return np.sort(order[:split]), np.sort(order[split:])
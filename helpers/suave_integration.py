@@ -1,5 +1,6 @@
 import requests
 import re
+import os
 from urllib.parse import urlparse
 from IPython.display import Markdown, display
 import ipywidgets as widgets
@@ -80,3 +81,24 @@ def save_csv_file(df, absolutePath, csv_file):
     return new_file
 
 
+
+def save_csv_chunks(chunks, absolutePath, csv_file):
+    # same as save_csv_file, for surveys processed in chunks (see panel_libs.SurveyChunks)
+    new_file = absolutePath + csv_file[:-4]+'_v1.csv'
+    # written under another name, so that a failure partway leaves no partial new_file
+    partial_file = new_file + '.' + str(os.getpid()) + '.tmp'
+    header = True
+    try:
+        for chunk in chunks:
+            chunk.to_csv(partial_file, index=None, header=header, mode='w' if header else 'a')
+            header = False
+        # nothing was written, new_file would be missing or left from an earlier run
+        if header:
+            raise ValueError('No rows to save to ' + new_file)
+        os.replace(partial_file, new_file)
+    finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+    printmd("<b><span style='color:red'>A new temporary file was created at: </span></b>")
+    print(new_file)
+    return new_file
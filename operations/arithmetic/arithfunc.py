@@ -0,0 +1,35 @@
+import operator
+import numpy as np
+import pandas as pd
+
+# operations offered by SuaveArithmetic.ipynb
+ops = {"+": operator.add, "-": operator.sub, "/": operator.truediv, "*": operator.mul}
+
+def compute_variable(df, variables, operators):
+    """
+    Applies the selected operations from left to right, e.g.
+    variables [a, b, c] and operators ['+', '*'] compute (a + b) * c.
+    """
+    temp = df[variables[0]]
+    for op, var in zip(operators, variables[1:]):
+        temp = ops[op](temp, df[var])
+    return temp
+
+def format_variable(col):
+    """
+    Formats a computed variable for SuAVE: infinite or missing values
+    become empty strings and numbers are written with six decimals.
+    """
+    col = col.replace([np.inf, -np.inf], np.nan)
+    col = pd.to_numeric(col, errors='coerce', downcast='float')
+    return col.apply(lambda x: '{:.6f}'.format(x)).replace('nan', '')
+
+def compute_chunked(chunks, variables, operators, new_name):
+    """
+    Streaming version of the notebook computation for surveys read in chunks
+    (see panel_libs.SurveyChunks). Yields every chunk with the new variable
+    appended as the last column.
+    """
+    for chunk in chunks:
+        chunk[new_name] = format_variable(compute_variable(chunk, variables, operators))
+        yield chunk
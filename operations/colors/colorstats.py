@@ -0,0 +1,268 @@
+""" Image Color Statistics
+
+This script computes the color statistics of the images of a survey
+(see ColorStats.ipynb): the mean, median, root-mean-square and
+standard deviation of the lightness, hue, saturation, brightness and
+red, green and blue bands of each image.
+
+Each image is decoded once, optionally downsampled while decoding,
+and all bands are summarized from NumPy histograms. The statistics
+are the ones PIL's ImageStat gives for the same bands. Images are
+processed across a pool of processes.
+
+To achieve this functionality, simply run color_stats() with the
+paths of the images, e.g. from image_files(). Use
+stored_color_stats() instead to keep the statistics of each
+collection in the feature store (helpers/feature_store.py), so that
+reruns only read new or changed images.
+
+This script requires that numpy, pandas and Pillow be installed
+within the Python environment you are running this script on.
+"""
+
+
+# Importing libraries
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+import sys
+sys.path.insert(1, '../../helpers')
+import feature_store
+
+
+# Bands summarized for each image, and their statistics
+bands = ['Lightness', 'Hue', 'Saturation', 'Brightness', 'Red', 'Green', 'Blue']
+statistics = ['mean', 'median', 'rms', 'std']
+stat_columns = [band + '_' + stat for band in bands for stat in statistics]
+
+
+def image_files(full_images_location, dzi_level=None):
+    """
+    image_files finds the full-size images of a collection. With
+    dzi_level, the first tile of that level of each image's Deep
+    Zoom pyramid (next to the full_images folder) is used instead,
+    which is much smaller but less accurate.
+
+    :param full_images_location: string representing path to the
+                                 full_images folder
+    :param dzi_level: integer, Deep Zoom level to use, None for the
+                      full-size images
+    :returns: dictionary of image name (#img) to file path
+    """
+
+    files = {}
+    for file in sorted(glob.glob(os.path.join(full_images_location, '*.png'))):
+        name = os.path.basename(file)[:-4]
+        if dzi_level is not None:
+            collection = os.path.dirname(os.path.normpath(full_images_location))
+            file = os.path.join(collection, name + '_files', str(dzi_level), '0_0.jpg')
+        files[name] = file
+    return files
+
+
+def load_bands(path, max_size=None):
+    """
+    load_bands decodes an image once and returns its L, H, S, V,
+    R, G and B bands. With max_size, the image is downsampled while
+    decoding (JPEG draft mode) or right after (reduce), to at most
+    about max_size pixels on its longest side.
+
+    :param path: string representing path to the image
+    :param max_size: integer, longest side to downsample to, None
+                     to keep the full resolution
+    :returns: list of 7 uint8 arrays
+    """
+
+    with Image.open(path) as im:
+        if max_size is not None:
+            im.draft('RGB', (max_size, max_size))
+            factor = max(im.size) // max_size
+            if factor > 1:
+                im = im.reduce(factor)
+        rgb = im.convert('RGB')
+
+    lightness = np.asarray(rgb.convert('L'))
+    hsv = np.asarray(rgb.convert('HSV'))
+    rgb = np.asarray(rgb)
+    return [lightness] + [hsv[..., i] for i in range(3)] + [rgb[..., i] for i in range(3)]
+
+
+def histogram_stats(histograms):
+    """
+    histogram_stats computes mean, median, rms and standard
+    deviation from 256-bin histograms, like ImageStat.
+
+    :param histograms: array of shape (bands, 256)
+    :returns: array of shape (bands, 4)
+    """
+
+    histograms = histograms.astype(np.float64)
+    values = np.arange(256, dtype=np.float64)
+    count = histograms.sum(axis=1)
+    total = histograms @ values
+    squares = histograms @ (values ** 2)
+
+    mean = total / count
+    # ImageStat's median is the first value past half of the pixels
+    median = np.argmax(histograms.cumsum(axis=1) > (count // 2)[:, None], axis=1)
+    rms = np.sqrt(squares / count)
+    std = np.sqrt((squares - total ** 2 / count) / count)
+    return np.column_stack([mean, median, rms, std])
+
+
+def image_stats(path, max_size=None):
+    """
+    :param path: string representing path to the image
+    :param max_size: integer, longest side to downsample to, None
+                     to keep the full resolution
+    :returns: array of the statistics in stat_columns
+    """
+
+    histograms = np.stack([np.bincount(band.ravel(), minlength=256)
+                           for band in load_bands(path, max_size)])
+    return histogram_stats(histograms).ravel()
+
+
+def safe_image_stats(item):
+    """Statistics or error message of a (path, max_size) item, for the process pool."""
+    path, max_size = item
+    try:
+        return image_stats(path, max_size), None
+    except Exception as e:
+        return None, str(e)
+
+
+def iter_stats(files, max_size=None, max_workers=None, chunksize=16):
+    """
+    iter_stats computes the color statistics of images across a
+    pool of processes, yielding them as they are ready.
+
+    :param files: dictionary of image name (#img) to file path
+    :param max_size: integer, longest side to downsample to, None
+                     to keep the full resolution
+    :param max_workers: integer, number of processes
+    :param chunksize: integer, images sent to a process at a time
+    :returns: generator of (image name, statistics, error message),
+              in the order of files
+    """
+
+    names = list(files)
+    items = [(files[name], max_size) for name in names]
+
+    if len(items) <= chunksize:
+        for name, result in zip(names, map(safe_image_stats, items)):
+            yield (name,) + result
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(safe_image_stats, items, chunksize=chunksize)
+        for name, result in zip(names, results):
+            yield (name,) + result
+
+
+def color_stats(files, max_size=None, max_workers=None, chunksize=16, progress=None):
+    """
+    color_stats computes the color statistics of images across a
+    pool of processes.
+
+    :param files: dictionary of image name (#img) to file path
+    :param max_size: integer, longest side to downsample to, None
+                     to keep the full resolution
+    :param max_workers: integer, number of processes
+    :param chunksize: integer, images sent to a process at a time
+    :param progress: function called with the number of images
+                     processed so far
+    :returns: data frame with an #img column and a column per
+              statistic, and dictionary of image name to error
+              message for the images that could not be read
+    """
+
+    found, errors = {}, {}
+    results = iter_stats(files, max_size, max_workers, chunksize)
+    for i, (name, stats, error) in enumerate(results):
+        if error is None:
+            found[name] = stats
+        else:
+            errors[name] = error
+        if progress is not None:
+            progress(i + 1)
+
+    return stats_frame(found), errors
+
+
+def stored_color_stats(files, full_images_location, dzi_level=None, max_size=None,
+                       max_workers=None, chunksize=16, progress=None, root=None):
+    """
+    stored_color_stats computes the color statistics of images
+    like color_stats, but only for the images that are new or
+    changed since the last run. The statistics are kept in the
+    feature store, with the size and modification time of each
+    file, so unchanged images are not read again.
+
+    :param files: dictionary of image name (#img) to file path, from
+                  image_files(full_images_location, dzi_level)
+    :param full_images_location: string representing path to the
+                                 full_images folder
+    :param dzi_level: integer, Deep Zoom level the files are from
+    :param max_size: integer, longest side to downsample to, None
+                     to keep the full resolution
+    :param max_workers: integer, number of processes
+    :param chunksize: integer, images sent to a process at a time
+    :param progress: function called with the number of images
+                     done so far, stored ones included
+    :param root: string representing path to the feature store
+    :returns: data frame with an #img column and a column per
+              statistic, and dictionary of image name to error
+              message for the images that could not be read
+    """
+
+    errors, signatures = {}, {}
+    for name, path in files.items():
+        try:
+            status = os.stat(path)
+            signatures[name] = (status.st_size, status.st_mtime_ns)
+        except OSError as e:
+            errors[name] = str(e)
+
+    params = {'dzi_level': dzi_level, 'max_size': max_size}
+    store = feature_store.FeatureStore(os.path.abspath(full_images_location), 'color_stats',
+                                       params, root, dtype='float64')
+    names = list(signatures)
+    done = [len(names) - len(store.missing(names, signatures)) + len(errors)]
+    if (progress is not None) and done[0]:
+        progress(done[0])
+
+    def compute(missing):
+        rows = np.full((len(missing), len(stat_columns)), np.nan)
+        results = iter_stats({name: files[name] for name in missing}, max_size, max_workers,
+                             chunksize)
+        for i, (name, stats, error) in enumerate(results):
+            if error is None:
+                rows[i] = stats
+            else:
+                errors[name] = error
+            done[0] += 1
+            if progress is not None:
+                progress(done[0])
+        return rows
+
+    matrix = store.get(names, compute, signatures, batch_size=500)
+    found = {name: row for name, row in zip(names, matrix) if name not in errors}
+    return stats_frame(found), errors
+
+
+def stats_frame(found):
+    """
+    :param found: dictionary of image name to array of statistics
+    :returns: data frame with an #img column and a column per statistic
+    """
+
+    values = np.vstack(list(found.values())) if found else np.empty((0, len(stat_columns)))
+    stats_df = pd.DataFrame(values, columns=stat_columns)
+    stats_df.insert(0, '#img', list(found))
+    return stats_df
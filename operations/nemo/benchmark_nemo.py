@@ -0,0 +1,134 @@
+""" Nemo Pipeline Benchmark
+
+This script times the annotation of a synthetic survey against the
+local Nemo stub server (see nemo_stub): one request per row and per
+linked entity as suave_nemo.ipynb used to do, then NemoClient and
+WikidataResolver with a cold and a warm cache. It also times the
+parsing of a single synthetic response with many entities
+(parse_nemo and create_nemo_dict).
+
+To run it (from this directory):
+
+    python benchmark_nemo.py --rows 2000 --latency 0.05 --entities 5000
+"""
+
+
+# Importing libraries
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import requests
+
+import nemoclient
+import nemofunc as nemo
+from nemo_stub import StubNemoServer, annotate
+
+
+# Words the synthetic survey texts are made of
+WORDS = ['San', 'Diego', 'California', 'Mexico', 'river', 'wildfire', 'evacuation',
+         'hospital', 'residents', 'the', 'of', 'and', '12', '2020', 'Pacific',
+         'community', 'drought', 'Tijuana', 'school', 'water']
+
+
+def make_texts(rows, distinct, seed=0):
+    """
+    :param rows: integer, number of texts
+    :param distinct: integer, number of distinct texts
+    :returns: list of strings
+    """
+
+    rng = random.Random(seed)
+    pool = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 40)))
+            for _ in range(distinct)]
+    return [rng.choice(pool) for _ in range(rows)]
+
+
+def run_serial(texts, url, wiki_url):
+    """One request per row and one per linked entity, without pooling or caching."""
+    results = []
+    for text in texts:
+        response = requests.post(url, params={'appid': 'stub'}, data=nemo.nemo_payload(text),
+                                 headers={'Content-type': 'application/json'})
+        df, resp_full = nemo.parse_nemo(response.content.decode('utf-8'))
+        for ref in df.loc[df['WP'] == 'y', 'Ref']:
+            requests.get(wiki_url, params={'action': 'query', 'prop': 'pageprops',
+                                           'ppprop': 'wikibase_item', 'redirects': 1,
+                                           'format': 'json', 'titles': ref}).json()
+        results.append((df, resp_full))
+    return results
+
+
+def time_parsing(entities, repeat=5):
+    """
+    :param entities: integer, number of words in the synthetic response
+    :returns: number of entities parsed and best time of parse_nemo
+              and create_nemo_dict, in seconds
+    """
+
+    rng = random.Random(0)
+    response = annotate(' '.join(rng.choice(WORDS) + str(i) for i in range(entities)))
+
+    parse_times, dict_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df, resp_full = nemo.parse_nemo(response)
+        parse_times.append(time.perf_counter() - start)
+
+        df.loc[df['WP'] == 'y', 'WP_ID'] = 'Q1'
+        start = time.perf_counter()
+        nemo.create_nemo_dict(df)
+        dict_times.append(time.perf_counter() - start)
+
+    return len(df), min(parse_times), min(dict_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--distinct', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--skip-serial', action='store_true')
+    parser.add_argument('--entities', type=int, default=5000)
+    args = parser.parse_args()
+
+    texts = make_texts(args.rows, args.distinct)
+
+    with StubNemoServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'nemo_cache.db')
+        client = nemoclient.NemoClient('stub', url=server.url, max_workers=args.workers,
+                                       cache_path=cache_path)
+        resolver = nemoclient.WikidataResolver(url=server.wiki_url, cache_path=cache_path)
+
+        timings = []
+        def timed(name, function, *args):
+            requests_before = server.requests + server.wiki_requests
+            start = time.perf_counter()
+            function(*args)
+            requests_made = server.requests + server.wiki_requests - requests_before
+            timings.append((name + ', ' + str(requests_made) + ' requests',
+                            time.perf_counter() - start))
+
+        if not args.skip_serial:
+            timed('serial', run_serial, texts, server.url, server.wiki_url)
+        timed('client (cold cache)', nemo.nemo_annotate_all, texts, client, resolver)
+        # A new resolver only has the ids cached on disk
+        resolver = nemoclient.WikidataResolver(url=server.wiki_url, cache_path=cache_path)
+        timed('client (warm cache)', nemo.nemo_annotate_all, texts, client, resolver)
+
+    print(str(args.rows) + ' rows (' + str(args.distinct) + ' distinct), ' +
+          str(args.latency) + 's latency')
+    for name, seconds in timings:
+        print('  {:<40} {:8.2f}s'.format(name, seconds))
+
+    parsed, parse_time, dict_time = time_parsing(args.entities)
+    print('response with ' + str(args.entities) + ' words, ' + str(parsed) + ' distinct fragments')
+    print('  {:<40} {:8.4f}s'.format('parse_nemo', parse_time))
+    print('  {:<40} {:8.4f}s'.format('create_nemo_dict', dict_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+""" Local Nemo Stub Server
+
+This script runs a local stand-in for the Nemo annotation service,
+so that the annotation pipeline (nemoclient, nemofunc) can be run
+and benchmarked offline. Responses are deterministic: capitalized
+words are annotated as entities with Wikipedia links, numbers as
+quantities and other words of 8 letters or more as concepts.
+
+The same server answers Wikidata id queries like the MediaWiki API
+(at wiki_url), giving every title a made-up id.
+
+To achieve this functionality, use StubNemoServer as a context
+manager and point a NemoClient at its url:
+
+    with StubNemoServer(latency=0.05) as server:
+        client = nemoclient.NemoClient('stub', url=server.url, cache_path=None)
+        resolver = nemoclient.WikidataResolver(url=server.wiki_url, cache_path=None)
+
+This script only requires the Python standard library.
+"""
+
+
+# Importing libraries
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def annotate(text):
+    """
+    annotate produces a Nemo-like response for a text.
+
+    :param text: string, request body
+    :returns: string, response
+    """
+
+    fragments = []
+    for word in re.findall(r'[A-Za-z0-9.]+', text):
+        word = word.strip('.')
+        if word.isdigit():
+            fragments.append('<d type="quantity" value="' + word + '">' + word + '</d>')
+        elif word[:1].isupper() and word[1:].islower():
+            fragments.append('<e ref="' + word + '" type="G" name="' + word +
+                             '" wp="y">' + word + '</e>')
+        elif word.isalpha() and (len(word) >= 8):
+            fragments.append('<c ref="' + word + '" type="U" wp="n">' + word + '</c>')
+        else:
+            fragments.append(word)
+    return '"{' + ' '.join(fragments) + '}"'
+
+
+def wikidata_pages(titles):
+    """
+    wikidata_pages produces a MediaWiki-like pageprops query
+    result. Titles are normalized by capitalizing them.
+
+    :param titles: list of strings
+    :returns: dictionary, query result
+    """
+
+    normalized, pages = [], {}
+    for i, title in enumerate(titles):
+        final = title[:1].upper() + title[1:]
+        if final != title:
+            normalized.append({'from': title, 'to': final})
+        item = 'Q' + str(zlib.crc32(final.encode('utf-8')))
+        pages[str(i + 1)] = {'pageid': i + 1, 'title': final,
+                             'pageprops': {'wikibase_item': item}}
+    return {'batchcomplete': '', 'query': {'normalized': normalized, 'pages': pages}}
+
+
+class StubNemoServer:
+    """
+    StubNemoServer serves annotate() responses to POST
+    requests and wikidata_pages() results to GET requests
+    on a local port, from a background thread.
+
+    :param latency: float, seconds each response is delayed by
+    :param failure_rate: float, fraction of Nemo requests answered with
+                         503 Service Unavailable (to exercise retries)
+    :param port: integer, port to listen on, 0 for any free port
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, port=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.wiki_requests = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with server.lock:
+                    server.requests += 1
+                time.sleep(server.latency)
+                if random.random() < server.failure_rate:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                content = annotate(body.decode('utf-8')).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                titles = query.get('titles', [''])[0].split('|')
+                with server.lock:
+                    server.wiki_requests += 1
+                time.sleep(server.latency)
+                content = json.dumps(wikidata_pages(titles)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:' + str(self.httpd.server_address[1]) + '/nemo'
+        self.wiki_url = 'http://127.0.0.1:' + str(self.httpd.server_address[1]) + '/w/api.php'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
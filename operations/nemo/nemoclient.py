@@ -0,0 +1,280 @@
+""" Nemo Annotation Client
+
+This script sends texts to the Nemo annotation service. Requests
+share a pool of connections, run a few at a time, are retried with
+backoff when they fail, and their raw responses are stored in a
+persistent on-disk cache keyed by a hash of the request, so that
+identical texts (within a survey or across reruns) are only
+annotated once.
+
+To achieve this functionality, create a NemoClient and run
+annotate_all() with a list of request bodies (see
+nemofunc.nemo_payload).
+
+The Wikidata ids of annotated entities are found the same way, in
+batches of titles, with a WikidataResolver.
+
+This script requires that requests be installed within the Python
+environment you are running this script on.
+"""
+
+
+# Importing libraries
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Nemo service and default location of the response cache
+NEMO_URL = 'https://nemoservice.azurewebsites.net/nemo'
+CACHE_PATH = '../../temp_csvs/nemo_cache.db'
+
+# MediaWiki API used to find the Wikidata ids of Wikipedia pages
+WIKIPEDIA_API = 'https://en.wikipedia.org/w/api.php'
+
+
+class DiskCache:
+    """
+    DiskCache stores string values by key on disk (SQLite), e.g.
+    raw Nemo responses keyed by the hash of the request body.
+
+    The cache should only be used from the thread that created it.
+
+    :param path: string representing path to the cache file
+    :param table: string, name of the table holding the values
+    """
+
+    def __init__(self, path=CACHE_PATH, table='responses'):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.table = table
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS ' + table +
+                                ' (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.commit()
+
+    def get_many(self, keys):
+        """
+        :param keys: list of strings
+        :returns: dictionary of key to cached value
+        """
+
+        found = {}
+        keys = list(keys)
+        # Stays under SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start+500]
+            query = ('SELECT key, value FROM ' + self.table + ' WHERE key IN (' +
+                     ','.join('?' * len(batch)) + ')')
+            found.update(self.connection.execute(query, batch))
+        return found
+
+    def put_many(self, values):
+        """
+        :param values: dictionary of key to value
+        """
+
+        self.connection.executemany('INSERT OR REPLACE INTO ' + self.table + ' VALUES (?, ?)',
+                                    list(values.items()))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class NemoClient:
+    """
+    NemoClient annotates texts with the Nemo service.
+
+    :param appid: string, Nemo application id
+    :param url: string, address of the Nemo service
+    :param max_workers: integer, concurrent requests
+    :param timeout: float, seconds to wait for a response
+    :param retries: integer, retries of failed requests
+    :param cache_path: string representing path to the response
+                       cache, None to not cache responses
+    """
+
+    def __init__(self, appid, url=NEMO_URL, max_workers=8, timeout=60, retries=3,
+                 cache_path=CACHE_PATH):
+        self.appid = appid
+        self.url = url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cache_path = cache_path
+
+        # Nemo requests are POSTs, which are not retried by default
+        retry = Retry(total=retries, backoff_factor=0.5, allowed_methods=None,
+                      status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=max_workers)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Content-type': 'application/json', 'Accept': 'text/plain'})
+
+    def post(self, body):
+        """
+        post sends a single request to the Nemo service.
+
+        :param body: string, request body
+        :returns: string, raw response
+        """
+
+        response = self.session.post(self.url, params={'appid': self.appid},
+                                     data=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content.decode('utf-8')
+
+    def annotate_all(self, bodies, progress=None):
+        """
+        annotate_all annotates every distinct request body,
+        serving repeated ones from the cache and sending the
+        others from a pool of threads.
+
+        :param bodies: list of strings, request bodies
+        :param progress: function called with the number of
+                         responses received so far
+        :returns: list of raw responses, in the order of bodies
+        """
+
+        bodies = list(bodies)
+        keys = [request_key(body) for body in bodies]
+        unique = dict(zip(keys, bodies))
+
+        cache = DiskCache(self.cache_path) if self.cache_path is not None else None
+        responses = cache.get_many(unique) if cache is not None else {}
+        missing = [key for key in unique if key not in responses]
+
+        # Responses are stored every 100, and when a request fails,
+        # so that an interrupted run keeps what it received
+        batch = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                received = executor.map(self.post, [unique[key] for key in missing])
+                for i, (key, response) in enumerate(zip(missing, received)):
+                    responses[key] = batch[key] = response
+                    if (len(batch) >= 100) and (cache is not None):
+                        cache.put_many(batch)
+                        batch.clear()
+                    if progress is not None:
+                        progress(i + 1)
+        finally:
+            if cache is not None:
+                cache.put_many(batch)
+                cache.close()
+
+        return [responses[key] for key in keys]
+
+
+class WikidataResolver:
+    """
+    WikidataResolver finds the Wikidata ids (wikibase_item) of
+    Wikipedia page titles, querying the MediaWiki API for up to
+    50 titles at a time. Ids are kept in memory and on disk, so
+    each title is only requested once. Titles without an id
+    resolve to an empty string.
+
+    :param url: string, address of the MediaWiki API
+    :param cache_path: string representing path to the id cache,
+                       None to only keep ids in memory
+    :param batch_size: integer, titles per query (at most 50)
+    :param timeout: float, seconds to wait for a response
+    :param retries: integer, retries of failed requests
+    """
+
+    def __init__(self, url=WIKIPEDIA_API, cache_path=CACHE_PATH, batch_size=50,
+                 timeout=30, retries=3):
+        self.url = url
+        self.cache_path = cache_path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.ids = {}
+
+        retry = Retry(total=retries, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504])
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+
+    def resolve(self, titles):
+        """
+        :param titles: iterable of strings
+        :returns: dictionary of title to Wikidata id
+        """
+
+        titles = [title for title in dict.fromkeys(titles) if isinstance(title, str)]
+        missing = [title for title in titles if title not in self.ids]
+
+        cache = DiskCache(self.cache_path, 'wikidata_ids') if self.cache_path is not None else None
+        try:
+            if cache is not None:
+                self.ids.update(cache.get_many(missing))
+                missing = [title for title in missing if title not in self.ids]
+
+            # '|' separates titles in a query, such titles are sent alone
+            batches = [[title] for title in missing if '|' in title]
+            batchable = [title for title in missing if '|' not in title]
+            batches += [batchable[i:i+self.batch_size]
+                        for i in range(0, len(batchable), self.batch_size)]
+
+            for batch in batches:
+                found = self.query(batch)
+                self.ids.update(found)
+                if cache is not None:
+                    cache.put_many(found)
+        finally:
+            if cache is not None:
+                cache.close()
+
+        return {title: self.ids[title] for title in titles}
+
+    def query(self, titles):
+        """
+        query requests the Wikidata ids of a batch of titles,
+        following title normalizations and redirects.
+
+        :param titles: list of strings
+        :returns: dictionary of title to Wikidata id
+        """
+
+        params = {'action': 'query', 'prop': 'pageprops', 'ppprop': 'wikibase_item',
+                  'redirects': 1, 'format': 'json', 'titles': '|'.join(titles)}
+        renamed, items = {}, {}
+        while True:
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            response = response.json()
+            query = response.get('query', {})
+            for change in query.get('normalized', []) + query.get('redirects', []):
+                renamed[change['from']] = change['to']
+            for page in query.get('pages', {}).values():
+                item = page.get('pageprops', {}).get('wikibase_item')
+                if item:
+                    items[page['title']] = item
+            if 'continue' not in response:
+                break
+            params.update(response['continue'])
+
+        found = {}
+        for title in titles:
+            # Normalization and redirect both rename a title
+            final = title
+            for _ in range(3):
+                final = renamed.get(final, final)
+            found[title] = items.get(final, '')
+        return found
+
+
+def request_key(body):
+    """
+    :param body: string, request body
+    :returns: string, hash of the body identifying its response
+    """
+
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
@@ -1,10 +1,12 @@
 import re
 import requests
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
 import json
 import urllib
 from IPython.display import Markdown, display
+import nemoclient
 
 def printmd(string):
     display(Markdown(string))
@@ -47,136 +49,138 @@ def extract_values(obj, key):
 # also, https://stackoverflow.com/questions/37024807/how-to-get-wikidata-id-for-an-wikipedia-article-by-api
 
 def get_WPID (name):
-    url = 'https://en.wikipedia.org/w/api.php?action=query&prop=pageprops&ppprop=wikibase_item&redirects=1&format=json&titles=' +urllib.parse.quote(name)
-    r=requests.get(url).json()
-    try:
-        ret = extract_values(r,'wikibase_item')[0]
-    except:
-        ret =''
-    return ret
+    return nemoclient.WikidataResolver().resolve([name]).get(name, '')
+
+
+def add_WPIDs(tables, resolver=None):
+    """
+    Fill in WP_ID for the entities with Wikipedia links (WP=='y') of
+    nemo tables, resolving each distinct Ref once, 50 per request
+    (see nemoclient.WikidataResolver).
+    """
+    if resolver is None:
+        resolver = nemoclient.WikidataResolver()
+
+    linked = [table['WP'] == 'y' for table in tables]
+    refs = [ref for table, mask in zip(tables, linked) for ref in table.loc[mask, 'Ref']]
+    ids = resolver.resolve(refs)
+
+    for table, mask in zip(tables, linked):
+        table.loc[mask, 'WP_ID'] = table.loc[mask, 'Ref'].map(ids)
     
     
-def nemo_annotate(payload):
+def nemo_payload(payload):
+    """Build the body of a Nemo request for a text."""
 
 #remove special characters and new lines, just in case
     payload = re.sub('[^a-zA-Z0-9\n\.]', ' ', payload)
     payload = payload.replace('\n',' ').strip()
     payload = payload.replace('|',' ')
     payload = str(payload.encode('utf-8'))
+
+    return '"{' + payload + '}"'
+
+
+def nemo_client(**kwargs):
+    """Create a Nemo client with the application id from the credentials file (see nemoclient.NemoClient)."""
+    return nemoclient.NemoClient(cfg['api_creds']['nmo1'], **kwargs)
+
+
+def nemo_annotate(payload, client=None, resolver=None):
     
-    # make a service request
+    return nemo_annotate_all([payload], client, resolver)[0]
+
+
+def nemo_annotate_all(payloads, client=None, resolver=None, progress=None):
+    """
+    Annotate many texts at once: distinct texts are sent concurrently and
+    cached responses are reused, then the Wikidata ids of all entities are
+    resolved together. Returns a list of (dataframe, response) tuples.
+    """
+    if client is None:
+        client = nemo_client()
+    # make the service requests (responses are cached, see nemoclient)
+    responses = client.annotate_all([nemo_payload(payload) for payload in payloads], progress)
+    results = [parse_nemo(a) for a in responses]
+
+    # for each found entity, add wikidata unique identifiers to the dataframe
+    add_WPIDs([df for df, resp_full in results], resolver)
+
+    return results
+
+
+# start and end tags of the xml fragments in the Nemo output
+fragment_tags = re.compile(r"<(?:e|d|c)\s|</(?:e|d|c)>")
+
+# dataframe columns and the fragment attributes they are read from
+nemo_attributes = [("Ref","ref"), ("EntityType","type"), ("Name","name"), ("Form","form"),
+                   ("WP","wp"), ("Value","value"), ("Alt","alt")]
 
-    url = "https://nemoservice.azurewebsites.net/nemo?appid=" + cfg['api_creds']['nmo1']
-    newHeaders = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-    response = requests.post(url,
-                             data='"{' + payload + '}"',
-                             headers=newHeaders)    
+
+def parse_nemo(a):
 
     # display the results as string (remove json braces)
-    a = response.content.decode('utf-8')
     resp_full = a[a.find('{')+1 : a.find('}')]
     
-    # create a dataframe with entities, remove duplicates, then add wikipedia/wikidata concept IDs
-    df = pd.DataFrame(columns=["Type","Ref","EntityType","Name","Form","WP","Value","Alt","WP_ID"])
-    
- 
-    # get starting and ending positions of xml fragments in the Nemo output
-    pattern_start = "<(e|d|c)\s"
-    iter = re.finditer(pattern_start,resp_full)
-    indices1 = [m.start(0) for m in iter]
-    pattern_end = "</(e|d|c)>"
-    iter = re.finditer(pattern_end,resp_full)
-    indices2 = [m.start(0) for m in iter]
-
-    # iterate over xml fragments returned by Nemo, extracting attributes from each and adding to dataframe
-    for i, entity in enumerate(indices1):
-        a = resp_full[indices1[i] : indices2[i]+4]
+    # get starting and ending positions of xml fragments in the Nemo output, in a single scan
+    indices1, indices2 = [], []
+    for m in fragment_tags.finditer(resp_full):
+        if m.group(0).startswith('</'):
+            indices2.append(m.start(0))
+        else:
+            indices1.append(m.start(0))
+
+    # parse each xml fragment returned by Nemo, collecting its attributes column by column
+    columns = {"Type": []}
+    columns.update({column: [] for column, attribute in nemo_attributes})
+    for start, end in zip(indices1, indices2):
+        a = resp_full[start : end+4]
         a = a.replace("&","&amp;").replace("'", "&apos;")
-
         
         try:
             root = ET.fromstring(a)
-            tag = root.tag
-            attributes = root.attrib
-
-            df = df.append({"Type":root.tag, 
-                    "Ref":attributes.get('ref'),
-                    "EntityType":attributes.get('type'),
-                    "Name":attributes.get('name'),
-                    "Form":attributes.get('form'),
-                    "WP":attributes.get('wp'),
-                    "Value":attributes.get('value'),
-                    "Alt":attributes.get('alt')},
-                   ignore_index=True)        
-        except:
+        except ET.ParseError:
             continue
+        
+        attributes = root.attrib
+        columns["Type"].append(root.tag)
+        for column, attribute in nemo_attributes:
+            columns[column].append(attributes.get(attribute))
     
-    # remove duplicate records from the df
+    # create a dataframe with entities, remove duplicates (wikidata ids are added by add_WPIDs)
+    df = pd.DataFrame(columns, dtype=object)
+    df["WP_ID"] = pd.Series(np.nan, index=df.index, dtype=object)
     df = df.drop_duplicates(keep='first')   
 
-    # for each found entity, add wikidata unique identifiers to the dataframe
-    for index, row in df.iterrows():
-        if (row['WP']=='y'):
-            row['WP_ID'] = get_WPID(row['Ref'])
-
     return df, resp_full
 
-def create_nemo_dict(nemotable):
 
-# define a dictionary where keys will be column names and values will be values for this ME<O result 
-    this_dict = {}   
+def create_nemo_dict(nemotable):
 
-    nemotable['WP'].fillna(value='n', inplace = True)
+# define a dictionary where keys will be column names and values will be values for this NEMO result 
+    nemotable['WP'] = nemotable['WP'].fillna(value='n')
 
 # create a new column for groupby
     nemotable['combo'] = nemotable['Type'] + "_" + nemotable['EntityType'] + "-" + nemotable['WP']
-    all_combos = nemotable['combo'].unique().tolist()
-#     all_combos
-# create a new dataframe with the columns we need only
-    selected_columns = nemotable[["Ref","WP_ID",'Value','combo']]
-    df1 = selected_columns.copy()
-
-# generate three types of tables. Note that they use different columns from the NEMO response
-    entities_concepts = df1.groupby('combo')['Ref'].apply(list).reset_index(name='thislist')
-    data_fields = df1.groupby('combo')['Value'].apply(list).reset_index(name='thislist')
-    WPIDs = df1.groupby('combo')['WP_ID'].apply(list).reset_index(name='thislist')
-    
-# Process the first table (entities and concepts)
-# drop rows that contain "d_" (data fields)
-    entities_concepts = entities_concepts[~entities_concepts['combo'].str.contains('d_')]
-
-# add them to the dictionary
-    for index, row in entities_concepts.iterrows():
-        this_dict.update( { row['combo'] : '|'.join(row['thislist'])})
-
-# Process the second table (entries that include data values)
-# only keep rows that contain d_, that is, contain data entries
-    data_fields = data_fields[data_fields['combo'].str.contains('d_')]
-
-# add them to the dictionary
-    for index, row in data_fields.iterrows():
-        this_dict.update( { row['combo'] : '|'.join(row['thislist'])})
-
-# Process the third table (entries that have associated WP links)
-# only keep rows that contain -y, that is, contain WP links
-    WPIDs = WPIDs[WPIDs['combo'].str.contains('-y')]
-
-# add them to the dictionary, changing keys to reflect that these are WP links, and changing values to URLs
-#     for index, row in WPIDs.iterrows():
-#         url_list = ["http://wikidata.org/wiki/"+e for e in row['thislist']]
-#         this_dict.update( { row['combo']+"_WP" : '|'.join(url_list)})
-
-# version with URLs wrapped in html:
-    for index, row in WPIDs.iterrows():
-        key_name = (row['combo'])
-        concept_names = this_dict[key_name].split("|")
-        url_list =[]
-        for x in range(len(row['thislist'])):
-            concept = concept_names[x]
-            wikidata = row['thislist'][x]
-            url_list.append("<a href='http://wikidata.org/wiki/"+ wikidata + "' target='_blank'>"+ concept+"</a>")
-        this_dict.update( { row['combo']+"_WP" : '<br/>'.join(url_list)})
-
+    df1 = nemotable[["Ref","WP_ID",'Value','combo']].dropna(subset=['combo'])
+
+# data fields ("d_" combos) list their values, entities and concepts their refs
+    is_data = df1['combo'].str.contains('d_', regex=False)
+    df1 = df1.assign(label=df1['Value'].where(is_data, df1['Ref']))
+    labels = df1.groupby('combo')['label'].agg('|'.join)
+
+# entities and concepts come first in the dictionary, then data fields
+    data_combos = labels.index.str.contains('d_', regex=False)
+    this_dict = labels[~data_combos].to_dict()
+    this_dict.update(labels[data_combos].to_dict())
+
+# entries that have associated WP links ("-y" combos) also get their URLs wrapped in html,
+# with keys changed to reflect that these are WP links
+    linked = df1[df1['combo'].str.contains('-y', regex=False)]
+    url_list = ("<a href='http://wikidata.org/wiki/" + linked['WP_ID'] + "' target='_blank'>" +
+                linked['label'] + "</a>")
+    WPIDs = url_list.groupby(linked['combo']).agg('<br/>'.join)
+    this_dict.update({combo + "_WP": urls for combo, urls in WPIDs.items()})
 
     return this_dict
 
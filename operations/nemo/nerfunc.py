@@ -0,0 +1,129 @@
+""" Named Entity Extraction with spaCy
+
+This script extracts named entities from survey texts with a spaCy
+model, producing one '|'-separated ner*#multi column per entity type
+(as in operations/tagger/NER.ipynb).
+
+Texts are deduplicated and only the distinct ones are processed, in
+batches with nlp.pipe (optionally across several processes), with the
+pipeline components that entities do not need disabled.
+
+To achieve this functionality, simply run extract_entities() with a
+Series of texts and a loaded spaCy model.
+
+This script requires that pandas and spacy be installed within the
+Python environment you are running this script on.
+"""
+
+
+# Importing libraries
+import multiprocessing
+import os
+import pandas as pd
+
+
+# spaCy entity labels and the columns they are extracted to
+ent_labels = ['PERSON', 'NORP', 'FAC', 'ORG', 'GPE', 'LOC', 'PRODUCT', 'EVENT',
+              'WORK_OF_ART', 'LAW', 'LANGUAGE', 'DATE']
+col_labels = ['nerPerson#multi', 'nerPopulation Group#multi', 'nerFacility#multi',
+              'nerOrganization#multi', 'nerAdministrative Area#multi', 'nerLocation#multi',
+              'nerProduct#multi', 'nerEvent#multi', 'nerWork of Art#multi',
+              'nerLegal Document#multi', 'nerLanguage#multi', 'nerDate#multi']
+
+# Pipeline components of the spaCy models that entities do not need
+unused_pipes = ('tagger', 'parser', 'attribute_ruler', 'lemmatizer',
+                'morphologizer', 'senter', 'textcat', 'textcat_multilabel')
+
+
+def properize(txt):
+    if len(txt) > 3:
+        txt = txt.title()
+    return txt
+
+
+def disabled_pipes(nlp):
+    """
+    disabled_pipes lists the components of a pipeline that
+    entity extraction does not need. Shared embedding layers
+    (tok2vec, transformer) are only disabled when no remaining
+    component listens to them.
+
+    :param nlp: spaCy Language
+    :returns: list of component names
+    """
+
+    disabled = [name for name in nlp.pipe_names if name in unused_pipes]
+    for name in ['tok2vec', 'transformer']:
+        if name in nlp.pipe_names:
+            listeners = getattr(nlp.get_pipe(name), 'listening_components', [])
+            if all(listener in disabled for listener in listeners):
+                disabled.append(name)
+    return disabled
+
+
+def extract_entities(texts, nlp, ent_labels=ent_labels, col_labels=col_labels,
+                     batch_size=1000, n_process=1):
+    """
+    extract_entities finds the entities of each text and joins
+    the distinct ones of each label with '|'.
+
+    With n_process > 1, custom pipeline components must be
+    importable by the worker processes.
+
+    :param texts: Series of strings
+    :param nlp: spaCy Language
+    :param ent_labels: list of entity labels to extract
+    :param col_labels: list of column names, one per entity label
+    :param batch_size: integer, number of texts per batch
+    :param n_process: integer, number of processes
+    :returns: data frame with a column per entity label, indexed
+              like texts
+    """
+
+    # Only distinct, non-empty texts are processed
+    codes, unique = pd.factorize(texts.fillna('').astype(str))
+    columns = {label: [''] * len(unique) for label in ent_labels}
+    to_process = [i for i, text in enumerate(unique) if text.strip()]
+
+    with nlp.select_pipes(disable=disabled_pipes(nlp)):
+        docs = nlp.pipe((unique[i] for i in to_process), batch_size=batch_size,
+                        n_process=n_process)
+        for i, doc in zip(to_process, docs):
+            found = {}
+            for ent in doc.ents:
+                if ent.label_ in columns:
+                    found.setdefault(ent.label_, {})[properize(ent.text)] = None
+            for label, names in found.items():
+                columns[label][i] = '|'.join(names)
+
+    extracted = pd.DataFrame({col: columns[label] for col, label in zip(col_labels, ent_labels)})
+    extracted = extracted.iloc[codes]
+    extracted.index = texts.index
+
+    return extracted
+
+
+def process_count(texts, max_process=4, texts_per_process=2000, needs_fork=False):
+    """
+    process_count chooses n_process for extract_entities: one
+    process per texts_per_process distinct texts (each process
+    loads its own copy of the model), up to max_process and the
+    number of CPUs.
+
+    Components defined outside of an importable module (e.g. in
+    a notebook) only reach the worker processes when they are
+    forked, so with needs_fork a single process is used on
+    platforms that start processes otherwise.
+
+    :param texts: Series of strings
+    :param max_process: integer, maximum number of processes
+    :param texts_per_process: integer, number of distinct texts
+                              per process
+    :param needs_fork: bool whether the pipeline has components
+                       defined outside of an importable module
+    :returns: integer, number of processes
+    """
+
+    if needs_fork and multiprocessing.get_context().get_start_method() != 'fork':
+        return 1
+    return max(1, min(max_process, os.cpu_count() or 1, texts.nunique() // texts_per_process))
@@ -0,0 +1,105 @@
+""" LeNet Model Size Benchmark
+
+This script builds LeNet variants (see lenet.py) for each pixel size
+offered by the size slider of PredictiveModel_v2.ipynb and reports,
+on CPU, their number of parameters, training throughput (images per
+second) and inference latency (milliseconds per image, one image at
+a time). Models with more parameters than --max-params are only
+counted, not timed.
+
+To run it (from this directory):
+
+    python benchmark_lenet.py --sizes 60 150 300 --steps 5
+"""
+
+
+# Importing libraries
+import argparse
+import os
+import time
+
+# The benchmark is about the CPU-only hub
+os.environ.setdefault('CUDA_VISIBLE_DEVICES', '')
+
+import numpy as np
+
+from lenet import LeNet
+
+
+# Variants compared: (name, width_mult, depth_mult, head)
+CONFIGS = [
+    ('original', 1.0, 1, 'flatten'),
+    ('half width', 0.5, 1, 'flatten'),
+    ('gap', 1.0, 1, 'gap'),
+    ('half width, gap', 0.5, 1, 'gap'),
+    ('quarter width, gap', 0.25, 1, 'gap'),
+    ('half width, deep, gap', 0.5, 2, 'gap'),
+]
+
+# Sizes of the notebook's size slider
+SIZES = list(range(20, 301, 10))
+
+
+def time_model(model, size, classes, batch_size=32, steps=5, repeat=20):
+    """
+    :param model: compiled Keras model
+    :param size: integer, side of the square input images
+    :param classes: integer, number of classes
+    :param batch_size: integer, images per training step
+    :param steps: integer, training steps timed
+    :param repeat: integer, single-image predictions timed
+    :returns: training throughput in images per second and
+              inference latency in milliseconds per image
+    """
+
+    rng = np.random.default_rng(0)
+    x = rng.random((batch_size, size, size, 3), dtype=np.float32)
+    y = np.eye(classes, dtype=np.float32)[rng.integers(0, classes, batch_size)]
+
+    # The first calls build the training and prediction functions
+    model.train_on_batch(x, y)
+    model.predict_on_batch(x[:1])
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.train_on_batch(x, y)
+    throughput = steps * batch_size / (time.perf_counter() - start)
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        model.predict_on_batch(x[:1])
+        latencies.append(time.perf_counter() - start)
+
+    return throughput, 1000 * float(np.median(latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--classes', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-params', type=int, default=50000000)
+    args = parser.parse_args()
+
+    print('{:>5}  {:<24} {:>14} {:>12} {:>12}'.format('size', 'model', 'parameters',
+                                                      'train img/s', 'latency ms'))
+    for size in args.sizes:
+        for name, width_mult, depth_mult, head in CONFIGS:
+            model = LeNet.build(width=size, height=size, depth=3, classes=args.classes,
+                                width_mult=width_mult, depth_mult=depth_mult, head=head)
+            params = model.count_params()
+            if params > args.max_params:
+                print('{:>5}  {:<24} {:>14,} {:>12} {:>12}'.format(size, name, params, '-', '-'))
+                continue
+            model.compile(loss='categorical_crossentropy', optimizer='adam')
+            throughput, latency = time_model(model, size, args.classes, args.batch_size,
+                                             args.steps, args.repeat)
+            print('{:>5}  {:<24} {:>14,} {:>12.1f} {:>12.2f}'.format(size, name, params,
+                                                                    throughput, latency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+""" Streaming Image Loader
+
+This script feeds survey images to the LeNet models of
+PredictiveModel_v2.ipynb and ExtendModel.ipynb without holding every
+image in memory as floats.
+
+Images are decoded and resized once, in a pool of threads, into a
+uint8 array kept on disk (.npy, memory-mapped) per image list and
+size, so reruns and other label columns do not decode them again.
+The arrays are rebuilt when an image file changes (size or
+modification time), and the least recently used ones are removed
+once the cache grows past CACHE_MAX_BYTES. Batches are then read
+from that array, scaled and augmented by a tf.data pipeline that
+prefetches the next batches while the model trains. Train/test
+splits are seeded (helpers/splits.py), so they are the same on every
+run.
+
+To achieve this functionality, run resized_images() with the paths
+of the images, split them with split_indices(), and pass the
+datasets of image_dataset() to model.fit() and model.predict().
+
+This script requires that numpy, opencv-python and tensorflow/keras
+be installed within the Python environment you are running this
+script on.
+"""
+
+
+# Importing libraries
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from keras import layers
+from keras.models import Sequential
+
+import sys
+sys.path.insert(1, '../../helpers')
+import feature_store
+from splits import split_indices
+
+
+# Default location of the resized images, and size above which the
+# least recently used arrays are removed
+CACHE_DIR = '../../temp_csvs/image_cache/'
+CACHE_MAX_BYTES = 16 * 1024**3
+
+
+def resized_images(paths, size, cache_dir=CACHE_DIR, max_workers=8, progress=None,
+                   max_bytes=CACHE_MAX_BYTES):
+    """
+    resized_images decodes and resizes images (BGR, as cv2.imread
+    reads them) into a uint8 array stored in cache_dir, or loads it
+    when the same images, unchanged since, were resized to the same
+    size before. Images that cannot be read are left black.
+
+    :param paths: list of strings representing paths to the images
+    :param size: integer, side of the square resized images
+    :param cache_dir: string representing path to the folder of the
+                      resized images
+    :param max_workers: integer, number of threads
+    :param progress: function called with the number of images
+                     resized so far
+    :param max_bytes: integer, size of cache_dir above which the least
+                      recently used arrays are removed
+    :returns: memory-mapped array of shape (images, size, size, 3)
+              and boolean array of the images that could be read
+    """
+
+    paths = list(paths)
+    # Edited images (other size or modification time) give another key
+    key = json.dumps([[(os.path.abspath(path), feature_store.file_signature(path))
+                       for path in paths], size])
+    path = os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    if os.path.exists(path + '.npy'):
+        # Marks the array as recently used for evict_cache
+        os.utime(path + '.npy')
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        evict_cache(cache_dir, max_bytes - len(paths) * size * size * 3)
+        # Written under other names, so that an interrupted run
+        # does not leave incomplete images behind
+        images = np.lib.format.open_memmap(path + '.partial.npy', mode='w+', dtype=np.uint8,
+                                           shape=(len(paths), size, size, 3))
+
+        def resize(i):
+            image = cv2.imread(paths[i])
+            if image is None:
+                return False
+            images[i] = cv2.resize(image, (size, size))
+            return True
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            readable = []
+            for done, ok in enumerate(executor.map(resize, range(len(paths)))):
+                readable.append(ok)
+                if progress is not None:
+                    progress(done + 1)
+
+        images.flush()
+        del images
+        np.save(path + '.readable.npy', np.array(readable, dtype=bool))
+        os.replace(path + '.partial.npy', path + '.npy')
+
+    return np.load(path + '.npy', mmap_mode='r'), np.load(path + '.readable.npy')
+
+
+def evict_cache(cache_dir, max_bytes):
+    """
+    evict_cache removes the least recently used arrays of cache_dir
+    until it is smaller than max_bytes.
+
+    :param cache_dir: string representing path to the folder of the
+                      resized images
+    :param max_bytes: integer, size to bring the folder under
+    """
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.npy') or name.endswith(('.readable.npy', '.partial.npy')):
+            continue
+        entry = os.path.join(cache_dir, name)
+        try:
+            status = os.stat(entry)
+        except FileNotFoundError:
+            continue
+        entries.append((status.st_mtime, status.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        for file in (entry, entry[:-len('.npy')] + '.readable.npy'):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def augmentation(seed=0):
+    """
+    :param seed: integer, seed of the random transformations
+    :returns: Keras model applying random rotations, shifts, zooms
+              and horizontal flips to image batches, like the
+              ImageDataGenerator of the notebooks (without shear)
+    """
+
+    return Sequential([
+        layers.RandomRotation(30 / 360, fill_mode='nearest', seed=seed),
+        layers.RandomTranslation(0.1, 0.1, fill_mode='nearest', seed=seed),
+        layers.RandomZoom(0.2, fill_mode='nearest', seed=seed),
+        layers.RandomFlip('horizontal', seed=seed),
+    ])
+
+
+def image_dataset(images, indices, labels=None, classes=None, batch_size=32, shuffle=False,
+                  augment=False, seed=0):
+    """
+    image_dataset streams batches of resized images, scaled to
+    [0, 1], reading only one batch at a time from images.
+
+    :param images: array from resized_images
+    :param indices: array of the positions of the images to use
+    :param labels: array of integer labels of all images, None for
+                   a dataset of images only (for predicting)
+    :param classes: integer, number of classes (for one-hot labels)
+    :param batch_size: integer, images per batch
+    :param shuffle: bool, whether to reshuffle the images each epoch
+    :param augment: bool, whether to apply augmentation()
+    :param seed: integer, seed of the shuffles and augmentations
+    :returns: tf.data.Dataset of image batches, or (images, labels)
+              batches when labels are given
+    """
+
+    indices = np.asarray(indices, dtype=np.int64)
+    size = images.shape[1:]
+
+    def gather(batch):
+        # Sorted positions read the memory-mapped array in order
+        order = np.argsort(batch)
+        values = np.empty((len(batch),) + size, dtype=np.uint8)
+        values[order] = images[batch[order]]
+        return values
+
+    def load(batch):
+        values = tf.numpy_function(gather, [batch], tf.uint8)
+        values.set_shape((None,) + size)
+        return tf.cast(values, tf.float32) / 255.0
+
+    if labels is not None:
+        targets = np.eye(classes, dtype=np.float32)[np.asarray(labels)[indices]]
+        dataset = tf.data.Dataset.from_tensor_slices((indices, targets))
+    else:
+        dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    if labels is not None:
+        dataset = dataset.map(lambda batch, y: (load(batch), y),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+
+    if augment:
+        transform = augmentation(seed)
+        if labels is not None:
+            dataset = dataset.map(lambda x, y: (transform(x, training=True), y),
+                                  num_parallel_calls=tf.data.AUTOTUNE)
+        else:
+            dataset = dataset.map(lambda x: transform(x, training=True),
+                                  num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -6,11 +6,21 @@ from keras.layers.core import Activation
 from keras.layers.core import Flatten
 from keras.layers.core import Dense
 from keras.layers.core import Dropout
+from keras.layers import GlobalAveragePooling2D
 from keras import backend as K
 
 class LeNet:
 	@staticmethod
-	def build(width, height, depth, classes):
+	def build(width, height, depth, classes, width_mult=1.0, depth_mult=1, head="flatten"):
+		# width_mult scales the number of filters and hidden units,
+		# depth_mult sets the number of CONV => RELU layers per block,
+		# and head is "flatten" (FC layer on all activations) or "gap"
+		# (FC layer on the global average of each filter, far fewer
+		# parameters for large images); the defaults build the
+		# original network
+		def scaled(units):
+			return max(1, int(round(units * width_mult)))
+
 		# initialize the model
 		model = Sequential()
 		inputShape = (height, width, depth)
@@ -19,25 +29,25 @@ class LeNet:
 		if K.image_data_format() == "channels_first":
 			inputShape = (depth, height, width)
 
-		# first set of CONV => RELU => POOL layers
-		model.add(Conv2D(64, (3, 3), padding="same",
-			input_shape=inputShape))
-		model.add(Activation("relu"))
-		model.add(MaxPooling2D(pool_size=(2, 2), strides=(2, 2)))
+		# three sets of CONV => RELU (x depth_mult) => POOL layers
+		for block, filters in enumerate([64, 128, 256]):
+			for layer in range(depth_mult):
+				if (block == 0) and (layer == 0):
+					model.add(Conv2D(scaled(filters), (3, 3), padding="same",
+						input_shape=inputShape))
+				else:
+					model.add(Conv2D(scaled(filters), (3, 3), padding="same"))
+				model.add(Activation("relu"))
+			model.add(MaxPooling2D(pool_size=(2, 2), strides=(2, 2)))
 
-		# second set of CONV => RELU => POOL layers
-		model.add(Conv2D(128, (3, 3), padding="same"))
-		model.add(Activation("relu"))
-		model.add(MaxPooling2D(pool_size=(2, 2), strides=(2, 2)))
-        
-		# third set of CONV => RELU => POOL layers
-		model.add(Conv2D(256, (3, 3), padding="same"))
-		model.add(Activation("relu"))
-		model.add(MaxPooling2D(pool_size=(2, 2), strides=(2, 2)))
-              
 		# first (and only) set of FC => RELU layers
-		model.add(Flatten())
-		model.add(Dense(1000))
+		if head == "gap":
+			model.add(GlobalAveragePooling2D())
+		elif head == "flatten":
+			model.add(Flatten())
+		else:
+			raise ValueError("head must be 'flatten' or 'gap'")
+		model.add(Dense(scaled(1000)))
 		model.add(Activation("relu"))
 		model.add(Dropout(0.5))
 
@@ -2,6 +2,9 @@ import matplotlib.pyplot as plt
 import panel as pn 
 import numpy as np 
 import pandas as pd 
+import scipy.sparse as sp
+import hashlib
+import os
 import re
 pn.extension()
 
@@ -40,23 +43,32 @@ def plot_dates(df, plotting_pane, selected_date):
     plotting_pane.object = fig
     plt.close()
 
+def explode_multi(df, var):
+    """
+    Helper function to split #multi survey variables into one entry per
+    (row position, value) pair
+    """
+    col = pd.Series(df[var].to_numpy(), index=np.arange(len(df))).dropna()
+    return col.astype(str).str.split('|').explode()
+
+def multi_indicator(df, var):
+    """
+    Helper function to return all unique entries for #multi survey variables
+    along with a sparse row x entry membership matrix
+    """
+    entries = explode_multi(df, var)
+    codes, levels = pd.factorize(entries)
+    indicator = sp.csr_matrix((np.ones(len(codes), dtype=np.int64), (entries.index.to_numpy(dtype=np.int64), codes)),
+                              shape=(len(df), len(levels)))
+    # rows repeating an entry (e.g. 'a|a') are summed on construction
+    indicator.data[:] = 1
+    return levels.to_list(), indicator
+
 def find_unique(df, var):
     """
     Helper function to return all unique entries for #multi survey variables
     """
-    arr = df[var].unique()
-    all_entries = set()
-    for i in range(len(arr)):
-        if arr[i] != arr[i]:
-            continue
-        if (i != 0) and ('|' in arr[i]):
-            arr[i] = arr[i].split('|')
-            for j in arr[i]:
-                all_entries.add(j)
-        else:
-            all_entries.add(arr[i])
-    all_entries = list(all_entries)
-    return all_entries
+    return explode_multi(df, var).unique().tolist()
 
 def find_tags(value):
     """
@@ -72,15 +84,14 @@ def get_factors(df):
     Helper function to collect all variables and their respective levels from the 
     input survey and outputs a resulting array containing all variables + levels.
     """
-    out = np.array([])
+    out = []
     for f in list(df.columns):
         if '#multi' in f:
             levels = find_unique(df, f)
         else:
             levels = df[f].value_counts().index.to_list()
-        levels = [str(f) + '_' + str(i) for i in levels]
-        out = np.append(out, levels)
-    return out
+        out.extend(str(f) + '_' + str(i) for i in levels)
+    return np.array(out)
 
 def convert_factor(variable, input_level):
     """
@@ -95,6 +106,71 @@ def convert_factor(variable, input_level):
         left, right = [i.strip('[]() ') for i in input_level.split(',')]
         return pd.Interval(pd.Timestamp(left), pd.Timestamp(right), closed='left')
 
+def split_level(level):
+    """
+    Helper function to split a level from get_factors into its variable
+    and factor, converting #number and #date factors into intervals
+    """
+    var, factor = level.split('_')
+    level_tag = var.split('#')[1]
+    if level_tag == 'number' or level_tag == 'date':
+        factor = convert_factor(var, factor)
+    return var, factor
+
+def level_codes(df, var):
+    """
+    Helper function to factorize a variable into integer codes once. Returns a
+    dictionary mapping each level to its code along with the row positions and
+    codes of every occurrence. #multi entries are split, so a row can hold
+    several levels.
+    """
+    if '#multi' in var:
+        levels, indicator = multi_indicator(df, var)
+        indicator = indicator.tocoo()
+        return dict(zip(levels, range(len(levels)))), indicator.row, indicator.col
+    codes, uniques = pd.factorize(df[var])
+    rows = np.flatnonzero(codes >= 0)
+    return dict(zip(uniques, range(len(uniques)))), rows, codes[rows]
+
+def count_levels(df, var, mask):
+    """
+    Helper function to count every level of a variable both over the whole
+    survey and within the rows selected by mask. Returns a dictionary mapping
+    each level to its position in the count arrays.
+    """
+    lookup, rows, codes = level_codes(df, var)
+    a_counts = np.bincount(codes, minlength=len(lookup))
+    ax_counts = np.bincount(codes[mask[rows]], minlength=len(lookup))
+    return lookup, a_counts, ax_counts
+
+def summarize_contributions(levels, a_counts, ax_counts, x_count, n_rows, selected_name):
+    """
+    Helper function to compute accuracy, completeness and contribution for every
+    (variable, factor) pair in levels from its Count (A) and Count (AX) values.
+    """
+    a_counts = np.asarray(a_counts, dtype=np.int64)
+    ax_counts = np.asarray(ax_counts, dtype=np.int64)
+    x_prop = x_count/n_rows
+    # levels without rows (or a level of interest without rows) contribute nothing
+    defined = (a_counts > 0) & (x_count > 0)
+    ax_prop = np.divide(ax_counts, a_counts, out=np.zeros(len(a_counts)), where=defined)
+    completeness = ax_counts/x_count*100 if x_count > 0 else np.zeros(len(a_counts))
+    completeness = np.where(defined, completeness, 0)
+    contribution = (ax_prop - x_prop)*100
+    accuracy = ax_prop*100
+    out_dict = dict()
+    for i, (var, factor) in enumerate(levels):
+        value_name = var.split('#')[0] + ': ' + str(factor)
+        if selected_name == value_name:
+            continue
+        if defined[i]:
+            accuracy_i, completeness_i = round(float(accuracy[i]), 3), round(float(completeness[i]), 3)
+        else:
+            accuracy_i, completeness_i = 0, 0
+        out_dict[value_name] = [accuracy_i, completeness_i, round(float(contribution[i]), 3),
+                                int(a_counts[i]), int(ax_counts[i]), find_tags(var)]
+    return out_dict
+
 def find_factor_contributions(df, selected_var, selected_level, var_levels):
     """
     Helper function to find all the factor contributions at the level of the variable of interest. 
@@ -103,32 +179,199 @@ def find_factor_contributions(df, selected_var, selected_level, var_levels):
     if tag == 'number' or tag == 'date':
         selected_level = convert_factor(selected_var, selected_level)
 
-    x_count = df[df[selected_var]==selected_level].shape[0]    
-    x_prop = df[df[selected_var]==selected_level].shape[0]/df.shape[0]
-    out_dict = dict()
+    x_mask = np.asarray(df[selected_var]==selected_level, dtype=bool)
+    x_count = int(x_mask.sum())
+
+    # each variable is factorized once and all of its levels counted together
+    counts = dict()
+    levels, a_counts, ax_counts = [], [], []
     for level in var_levels:
-        var, factor = level.split('_')
-        level_tag = var.split('#')[1]
-        if level_tag == 'number' or level_tag == 'date':
-            factor = convert_factor(var, factor)
-
-
-        a_count = df[df[var]==factor].shape[0]
-        ax_count = df[(df[var]==factor) & (df[selected_var]==selected_level)].shape[0]
-        try:
-            ax_prop = ax_count/a_count
-            completeness = round((ax_count/x_count)*100, 3)
-        except:
-            ax_prop = 0
-            completeness = 0
-        contribution = round((ax_prop - x_prop)*100, 3)
-        accuracy = round(ax_prop*100, 3)
-        value_name = level.split('#')[0] + ': ' + str(factor)
+        var, factor = split_level(level)
+        if var not in counts:
+            counts[var] = count_levels(df, var, x_mask)
+        lookup, var_a_counts, var_ax_counts = counts[var]
+        idx = lookup.get(factor)
+        levels.append((var, factor))
+        a_counts.append(0 if idx is None else var_a_counts[idx])
+        ax_counts.append(0 if idx is None else var_ax_counts[idx])
+
+    selected_name = selected_var.split('#')[0] + ': ' + str(selected_level)
+    return summarize_contributions(levels, a_counts, ax_counts, x_count, df.shape[0], selected_name)
+
+def frame_fingerprint(df):
+    """
+    Helper function to hash the contents and column names of a dataframe
+    so that stored results can be checked against the current survey.
+    """
+    digest = hashlib.sha1('\x1f'.join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def cube_path(absolutePath, csv_file):
+    """
+    Helper function to return the location of the stored contingency cube
+    of a survey, next to the survey file itself.
+    """
+    return absolutePath + os.path.splitext(csv_file)[0] + '_cube.npz'
+
+class ContingencyCube:
+    """
+    Helper class holding the pairwise co-occurrence counts of every level
+    returned by get_factors as a sparse level x level matrix, so that the
+    factor contributions of any level of interest are a single row lookup.
+    """
+
+    def __init__(self, df, var_levels, counts=None, fingerprint=None):
+        self.reset(df, var_levels, counts, fingerprint)
+
+    def reset(self, df, var_levels, counts=None, fingerprint=None):
+        """
+        Sets the survey and levels of the cube, building the counts unless
+        they are given (e.g. loaded from disk).
+        """
+        self.df = df
+        self.var_levels = list(var_levels)
+        self.levels = [split_level(level) for level in self.var_levels]
+        self.index = {level: i for i, level in enumerate(self.levels)}
+        self.fingerprint = fingerprint if fingerprint is not None else frame_fingerprint(df)
+        # the row x level indicator is only needed to build the counts, so it
+        # is rebuilt lazily when the counts come from disk
+        self.indicator = None
+        if counts is None:
+            self.indicator = self.build_indicator()
+            counts = (self.indicator.T @ self.indicator).tocsr()
+        self.counts = counts
+
+    def build_indicator(self):
+        """
+        Builds the sparse survey row x level membership matrix, factorizing
+        every variable once.
+        """
+        rows, cols = [], []
+        by_var = dict()
+        for i, (var, factor) in enumerate(self.levels):
+            by_var.setdefault(var, []).append((factor, i))
+        for var, factors in by_var.items():
+            lookup, var_rows, codes = level_codes(self.df, var)
+            code_to_level = np.full(max(lookup.values(), default=-1) + 1, -1)
+            for factor, i in factors:
+                if factor in lookup:
+                    code_to_level[lookup[factor]] = i
+            level_of_row = code_to_level[codes]
+            found = level_of_row >= 0
+            rows.append(var_rows[found])
+            cols.append(level_of_row[found])
+        rows = np.concatenate(rows) if rows else np.array([], dtype=int)
+        cols = np.concatenate(cols) if cols else np.array([], dtype=int)
+        return sp.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)),
+                             shape=(self.df.shape[0], len(self.levels)))
+
+    def update(self, df, var_levels=None):
+        """
+        Rebuilds the cube if the survey (or its levels) changed since it was built.
+        Returns True when a rebuild happened.
+        """
+        if var_levels is None:
+            var_levels = get_factors(df)
+        fingerprint = frame_fingerprint(df)
+        if (fingerprint == self.fingerprint) and (list(var_levels) == self.var_levels):
+            self.df = df
+            return False
+        self.reset(df, var_levels, fingerprint=fingerprint)
+        return True
+
+    def contributions(self, selected_var, selected_level):
+        """
+        Returns the factor contributions at the level of the variable of
+        interest, in the same form as find_factor_contributions.
+        """
+        tag = selected_var.split('#')[1]
+        if tag == 'number' or tag == 'date':
+            selected_level = convert_factor(selected_var, selected_level)
+
+        a_counts = self.counts.diagonal()
+        # levels of interest of #multi variables are whole entries (e.g. 'a|b'),
+        # not the split levels stored in the cube
+        j = None if '#multi' in selected_var else self.index.get((selected_var, selected_level))
+        if j is not None:
+            ax_counts = self.counts.getrow(j).toarray().ravel()
+            x_count = int(a_counts[j])
+        else:
+            # level of interest is not one of the stored levels, count it directly
+            if self.indicator is None:
+                self.indicator = self.build_indicator()
+            x_mask = np.asarray(self.df[selected_var]==selected_level, dtype=bool)
+            ax_counts = self.indicator.T @ x_mask.astype(np.int64)
+            x_count = int(x_mask.sum())
+
         selected_name = selected_var.split('#')[0] + ': ' + str(selected_level)
-        if selected_name == value_name:
-            continue
-        out_dict[value_name] = [accuracy,completeness,contribution,a_count,ax_count,find_tags(var)]
-    return out_dict
+        return summarize_contributions(self.levels, a_counts, ax_counts, x_count,
+                                       self.df.shape[0], selected_name)
+
+    def save(self, path):
+        """
+        Stores the co-occurrence counts and the survey fingerprint at path.
+        """
+        np.savez_compressed(path, data=self.counts.data, indices=self.counts.indices,
+                            indptr=self.counts.indptr, shape=self.counts.shape,
+                            var_levels=np.array(self.var_levels, dtype=str),
+                            fingerprint=self.fingerprint)
+
+    @classmethod
+    def load_or_build(cls, path, df, var_levels):
+        """
+        Loads the cube stored at path if it was built from the same survey
+        and levels, otherwise builds it and stores it at path.
+        """
+        var_levels = list(var_levels)
+        fingerprint = frame_fingerprint(df)
+        if os.path.exists(path):
+            with np.load(path) as stored:
+                if ((str(stored['fingerprint']) == fingerprint) and
+                        (stored['var_levels'].tolist() == var_levels)):
+                    counts = sp.csr_matrix((stored['data'], stored['indices'], stored['indptr']),
+                                           shape=tuple(stored['shape']))
+                    return cls(df, var_levels, counts=counts, fingerprint=fingerprint)
+        cube = cls(df, var_levels, fingerprint=fingerprint)
+        cube.save(path)
+        return cube
+
+def describe_chunked(chunks, columns):
+    """
+    Helper function to compute the mean, standard deviation, variance and skew
+    of numeric variables over a survey read in chunks (see panel_libs.SurveyChunks)
+    by merging the central moments of every chunk. Values match pandas' mean,
+    std, var and skew over the whole column.
+    """
+    moments = {col: (0, 0.0, 0.0, 0.0) for col in columns}
+    for chunk in chunks:
+        for col in columns:
+            x = pd.to_numeric(chunk[col]).dropna().to_numpy(dtype=float)
+            if len(x) == 0:
+                continue
+            n_b, mean_b = len(x), x.mean()
+            m2_b, m3_b = ((x - mean_b)**2).sum(), ((x - mean_b)**3).sum()
+            n_a, mean_a, m2_a, m3_a = moments[col]
+            n = n_a + n_b
+            delta = mean_b - mean_a
+            mean = mean_a + delta*n_b/n
+            m2 = m2_a + m2_b + delta**2*n_a*n_b/n
+            m3 = (m3_a + m3_b + delta**3*n_a*n_b*(n_a - n_b)/n**2
+                  + 3*delta*(n_a*m2_b - n_b*m2_a)/n)
+            moments[col] = (n, mean, m2, m3)
+
+    out = dict()
+    for col, (n, mean, m2, m3) in moments.items():
+        var = m2/(n - 1) if n > 1 else np.nan
+        if n < 3:
+            skew = np.nan
+        elif m2 == 0:
+            skew = 0.0
+        else:
+            skew = n*(n - 1)**0.5/(n - 2)*m3/m2**1.5
+        out[col] = {'count': n, 'mean': mean if n > 0 else np.nan,
+                    'std': np.sqrt(var), 'var': var, 'skew': skew}
+    return pd.DataFrame.from_dict(out, orient='index')
 
 def color(val):
     """
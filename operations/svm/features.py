@@ -0,0 +1,177 @@
+""" Image Histogram Features
+
+This script computes the histogram features of the SVM predictor
+(see histogram.py) for all the images of a survey at once. Each image
+is decoded once, in a pool of threads (OpenCV releases the GIL), and
+all the requested histograms are written into one preallocated
+float32 matrix, a row per image.
+
+The rows are kept in the feature store (helpers/feature_store.py),
+so that retraining on another label column, or with another histogram
+type, does not read any image again, and images added to the
+collection are the only ones processed.
+
+To achieve this functionality, run stored_features() (or
+extract_features() to not keep the matrix) with the images of a
+survey, then select the columns of a histogram type with
+feature_columns().
+
+This script requires that numpy, opencv-python and imutils be
+installed within the Python environment you are running this script
+on.
+"""
+
+
+# Importing libraries
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from histogram import Histograms
+
+import sys
+sys.path.insert(1, '../../helpers')
+import feature_store
+
+
+# Histogram types, numbered like the typeH of the SVM notebooks
+hist_types = {0: 'HSV Color Histogram', 1: 'Blue Histogram', 2: 'Red Histogram',
+              3: 'Green Histogram'}
+
+
+def feature_sizes(types, hsv_bins=(8, 8, 8), channel_bins=256):
+    """
+    :param types: list of histogram types (keys of hist_types)
+    :param hsv_bins: tuple, bins per channel of the HSV histogram
+    :param channel_bins: integer, bins of the blue, red and green histograms
+    :returns: dictionary of histogram type to number of features
+    """
+
+    return {typeH: int(np.prod(hsv_bins)) if typeH == 0 else channel_bins for typeH in types}
+
+
+def feature_columns(types, typeH, hsv_bins=(8, 8, 8), channel_bins=256):
+    """
+    :param types: list of histogram types the matrix was computed with
+    :param typeH: integer, histogram type to select
+    :param hsv_bins: tuple, bins per channel of the HSV histogram
+    :param channel_bins: integer, bins of the blue, red and green histograms
+    :returns: slice of the matrix columns holding typeH
+    """
+
+    start = 0
+    for current, size in feature_sizes(types, hsv_bins, channel_bins).items():
+        if current == typeH:
+            return slice(start, start + size)
+        start += size
+    raise KeyError('Histogram type ' + str(typeH) + ' was not computed')
+
+
+def image_histograms(image, types, hsv_bins=(8, 8, 8), channel_bins=256):
+    """
+    :param image: BGR image, as read by cv2.imread
+    :param types: list of histogram types
+    :param hsv_bins: tuple, bins per channel of the HSV histogram
+    :param channel_bins: integer, bins of the blue, red and green histograms
+    :returns: list of histograms, in the order of types
+    """
+
+    histograms = []
+    for typeH in types:
+        if typeH == 0:
+            histograms.append(Histograms.extract_color_histogram(image, hsv_bins))
+        elif typeH == 1:
+            histograms.append(Histograms.extract_blue_histogram(image, channel_bins))
+        elif typeH == 2:
+            histograms.append(Histograms.extract_red_histogram(image, channel_bins))
+        elif typeH == 3:
+            histograms.append(Histograms.extract_green_histogram(image, channel_bins))
+    return histograms
+
+
+def extract_features(paths, types=tuple(hist_types), out_path=None, hsv_bins=(8, 8, 8),
+                     channel_bins=256, max_workers=8, progress=None):
+    """
+    extract_features computes the histograms of every image into
+    a float32 matrix. Rows of images that cannot be read are NaN.
+
+    :param paths: list of strings representing paths to the images
+    :param types: list of histogram types to compute
+    :param out_path: string representing path to a .npy file to
+                     write the matrix to (memory-mapped), None to
+                     keep it in memory
+    :param hsv_bins: tuple, bins per channel of the HSV histogram
+    :param channel_bins: integer, bins of the blue, red and green histograms
+    :param max_workers: integer, number of threads
+    :param progress: function called with the number of images
+                     processed so far
+    :returns: matrix of shape (images, features)
+    """
+
+    paths = list(paths)
+    width = sum(feature_sizes(types, hsv_bins, channel_bins).values())
+    if out_path is None:
+        matrix = np.empty((len(paths), width), dtype=np.float32)
+    else:
+        matrix = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32,
+                                           shape=(len(paths), width))
+
+    def fill_row(i):
+        image = cv2.imread(paths[i])
+        if image is None:
+            matrix[i] = np.nan
+        else:
+            matrix[i] = np.concatenate(image_histograms(image, types, hsv_bins, channel_bins))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for done, _ in enumerate(executor.map(fill_row, range(len(paths)))):
+            if progress is not None:
+                progress(done + 1)
+
+    if out_path is not None:
+        matrix.flush()
+    return matrix
+
+
+def stored_features(image_dir, names, suffix='.jpg', types=tuple(hist_types), hsv_bins=(8, 8, 8),
+                    channel_bins=256, max_workers=8, progress=None, root=None):
+    """
+    stored_features returns the feature matrix of the images of a
+    collection from the feature store, computing only the rows of
+    images that have not been processed with the same parameters
+    before, or that changed since (size or modification time).
+
+    :param image_dir: string representing path to the images folder
+    :param names: list of image names (#img)
+    :param suffix: string, extension of the image files
+    :param types: list of histogram types to compute
+    :param hsv_bins: tuple, bins per channel of the HSV histogram
+    :param channel_bins: integer, bins of the blue, red and green histograms
+    :param max_workers: integer, number of threads
+    :param progress: function called with the number of images
+                     processed so far
+    :param root: string representing path to the feature store
+    :returns: matrix of shape (images, features)
+    """
+
+    params = {'suffix': suffix, 'types': list(types), 'hsv_bins': list(hsv_bins),
+              'channel_bins': channel_bins}
+    store = feature_store.FeatureStore(os.path.abspath(image_dir), 'svm_histograms', params, root)
+    done = []
+
+    def compute(missing):
+        paths = [os.path.join(image_dir, name + suffix) for name in missing]
+        report = None
+        if progress is not None:
+            report = lambda count: progress(sum(done) + count)
+        matrix = extract_features(paths, types, None, hsv_bins, channel_bins, max_workers, report)
+        done.append(len(missing))
+        return matrix
+
+    # Images replaced in place are recomputed
+    ids = [str(name) for name in names]
+    signatures = {name: feature_store.file_signature(os.path.join(image_dir, name + suffix))
+                  for name in ids}
+    return store.get(ids, compute, signatures)
@@ -21,9 +21,9 @@ class Histograms:
     
         return hist.flatten()
     
-    def extract_blue_histogram(image):
+    def extract_blue_histogram(image, bins=256):
         # extract blue histogram from the image
-        hist = cv2.calcHist([image], [0], None, [265], [0,256])
+        hist = cv2.calcHist([image], [0], None, [bins], [0,256])
     
         # handle normalizing the histogram if we are using OpenCV 2.4.X
         if imutils.is_cv2():
@@ -35,9 +35,9 @@ class Histograms:
     
         return hist.flatten()
     
-    def extract_green_histogram(image):
+    def extract_green_histogram(image, bins=256):
         # extract green histogram from the image
-        hist = cv2.calcHist([image], [1], None, [265], [0,256])
+        hist = cv2.calcHist([image], [1], None, [bins], [0,256])
     
         # handle normalizing the histogram if we are using OpenCV 2.4.X
         if imutils.is_cv2():
@@ -49,9 +49,9 @@ class Histograms:
     
         return hist.flatten()
     
-    def extract_red_histogram(image):
-        # extract blue histogram from the image
-        hist = cv2.calcHist([image], [2], None, [265], [0,256])
+    def extract_red_histogram(image, bins=256):
+        # extract red histogram from the image
+        hist = cv2.calcHist([image], [2], None, [bins], [0,256])
     
         # handle normalizing the histogram if we are using OpenCV 2.4.X
         if imutils.is_cv2():
@@ -0,0 +1,265 @@
+""" Frozen Backbone Embeddings
+
+This script supports transfer learning with a frozen, pretrained
+backbone (ResNet50 by default): every image is run through the
+backbone once, its pooled activations (the output of
+GlobalAveragePooling2D) are kept in the feature store
+(helpers/feature_store.py), and only a small model is trained on
+these vectors: a dense head like the one of transfer_learning.ipynb,
+a LinearSVC or a logistic regression.
+
+Training then takes seconds instead of running the backbone on every
+image at every epoch, and choosing another label column reuses the
+same embeddings. Splits and training are seeded, so results are
+reproducible.
+
+To achieve this functionality, run stored_embeddings() with the
+images of a survey, split them with split_indices(), and train with
+train_head() or train_linear().
+
+This script requires that numpy, opencv-python, scikit-learn and
+tensorflow/keras be installed within the Python environment you are
+running this script on.
+"""
+
+
+# Importing libraries
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import keras
+from keras import applications
+from keras.layers import Dense, Input
+from keras.models import Model
+from keras.optimizers import Adam
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import LinearSVC
+
+import sys
+sys.path.insert(1, '../../helpers')
+import feature_store
+from splits import split_indices
+
+
+# Pretrained backbones and their input preprocessing
+backbones = {
+    'ResNet50': (applications.ResNet50, applications.resnet50.preprocess_input),
+    'MobileNetV2': (applications.MobileNetV2, applications.mobilenet_v2.preprocess_input),
+}
+
+
+def backbone_model(backbone='ResNet50', image_size=224):
+    """
+    :param backbone: string, name of the backbone (keys of backbones)
+    :param image_size: integer, side of the square input images
+    :returns: frozen Keras model giving the pooled activations of an
+              image batch
+    """
+
+    network, _ = backbones[backbone]
+    model = network(weights='imagenet', include_top=False, pooling='avg',
+                    input_shape=(image_size, image_size, 3))
+    model.trainable = False
+    return model
+
+
+def load_batch(paths, image_size, backbone='ResNet50', executor=None):
+    """
+    load_batch decodes and resizes a batch of images for a backbone.
+
+    :param paths: list of strings representing paths to the images
+    :param image_size: integer, side of the square input images
+    :param backbone: string, name of the backbone
+    :param executor: thread pool decoding the images, None to decode
+                     them one after another
+    :returns: preprocessed array of shape (images, size, size, 3) and
+              boolean array of the images that could be read
+    """
+
+    batch = np.zeros((len(paths), image_size, image_size, 3), dtype=np.float32)
+
+    def load(i):
+        image = cv2.imread(paths[i])
+        if image is None:
+            return False
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        batch[i] = cv2.resize(image, (image_size, image_size), interpolation=cv2.INTER_AREA)
+        return True
+
+    readable = list(executor.map(load, range(len(paths))) if executor is not None
+                    else map(load, range(len(paths))))
+    _, preprocess = backbones[backbone]
+    return preprocess(batch), np.array(readable, dtype=bool)
+
+
+def embed_images(paths, backbone='ResNet50', image_size=224, batch_size=32, max_workers=8,
+                 progress=None):
+    """
+    embed_images runs images through a frozen backbone, decoding
+    the next batch while the current one is processed. Rows of
+    images that cannot be read are NaN.
+
+    :param paths: list of strings representing paths to the images
+    :param backbone: string, name of the backbone (keys of backbones)
+    :param image_size: integer, side of the square input images
+    :param batch_size: integer, images run through the backbone at a time
+    :param max_workers: integer, number of threads decoding images
+    :param progress: function called with the number of images
+                     processed so far
+    :returns: float32 matrix of shape (images, embedding size)
+    """
+
+    paths = list(paths)
+    model = backbone_model(backbone, image_size)
+    matrix = np.empty((len(paths), model.output_shape[-1]), dtype=np.float32)
+    batches = [paths[start:start+batch_size] for start in range(0, len(paths), batch_size)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+         ThreadPoolExecutor(max_workers=1) as prefetcher:
+        upcoming = None
+        if batches:
+            upcoming = prefetcher.submit(load_batch, batches[0], image_size, backbone, executor)
+        for i in range(len(batches)):
+            batch, readable = upcoming.result()
+            if i + 1 < len(batches):
+                upcoming = prefetcher.submit(load_batch, batches[i + 1], image_size, backbone,
+                                             executor)
+            values = np.asarray(model.predict_on_batch(batch), dtype=np.float32)
+            values[~readable] = np.nan
+            start = i * batch_size
+            matrix[start:start+len(values)] = values
+            if progress is not None:
+                progress(start + len(values))
+
+    return matrix
+
+
+def stored_embeddings(image_dir, names, suffix='.png', backbone='ResNet50', image_size=224,
+                      batch_size=32, max_workers=8, progress=None, root=None):
+    """
+    stored_embeddings returns the embeddings of the images of a
+    collection from the feature store, running the backbone only
+    on images that have not been embedded with the same parameters
+    before, or that changed since (size or modification time), and
+    not at all when every image is up to date.
+
+    :param image_dir: string representing path to the images folder
+    :param names: list of image names (#img)
+    :param suffix: string, extension of the image files
+    :param backbone: string, name of the backbone (keys of backbones)
+    :param image_size: integer, side of the square input images
+    :param batch_size: integer, images run through the backbone at a time
+    :param max_workers: integer, number of threads decoding images
+    :param progress: function called with the number of images
+                     processed so far
+    :param root: string representing path to the feature store
+    :returns: float32 matrix of shape (images, embedding size)
+    """
+
+    params = {'suffix': suffix, 'backbone': backbone, 'weights': 'imagenet',
+              'image_size': image_size}
+    store = feature_store.FeatureStore(os.path.abspath(image_dir), 'embeddings', params, root)
+    done = []
+
+    def compute(missing):
+        paths = [os.path.join(image_dir, name + suffix) for name in missing]
+        report = None
+        if progress is not None:
+            report = lambda count: progress(sum(done) + count)
+        matrix = embed_images(paths, backbone, image_size, batch_size, max_workers, report)
+        done.append(len(missing))
+        return matrix
+
+    # Images replaced in place are recomputed
+    ids = [str(name) for name in names]
+    signatures = {name: feature_store.file_signature(os.path.join(image_dir, name + suffix))
+                  for name in ids}
+    return store.get(ids, compute, signatures)
+
+
+def build_head(input_size, classes, units=(1024, 1024, 512)):
+    """
+    :param input_size: integer, size of the embeddings
+    :param classes: integer, number of classes
+    :param units: tuple, units of the hidden Dense layers
+    :returns: Keras model classifying embeddings
+    """
+
+    inputs = Input(shape=(input_size,))
+    outputs = inputs
+    for size in units:
+        outputs = Dense(size, activation='relu')(outputs)
+    outputs = Dense(classes, activation='softmax')(outputs)
+    return Model(inputs=inputs, outputs=outputs)
+
+
+def train_head(features, labels, classes, epochs=25, batch_size=32, learning_rate=1e-3,
+               validation=None, seed=0, units=(1024, 1024, 512)):
+    """
+    train_head trains a dense head on embeddings.
+
+    :param features: matrix of training embeddings
+    :param labels: array of integer training labels
+    :param classes: integer, number of classes
+    :param epochs: integer, passes over the training embeddings
+    :param batch_size: integer, embeddings per training step
+    :param learning_rate: float, learning rate of Adam
+    :param validation: tuple (features, labels) to report accuracy on
+    :param seed: integer, seed of the weights and of the shuffles
+    :param units: tuple, units of the hidden Dense layers
+    :returns: trained Keras model and its training history
+    """
+
+    keras.utils.set_random_seed(seed)
+    model = build_head(features.shape[1], classes, units)
+    model.compile(loss='categorical_crossentropy', optimizer=Adam(learning_rate=learning_rate),
+                  metrics=['accuracy'])
+    if validation is not None:
+        validation = (validation[0], keras.utils.to_categorical(validation[1], classes))
+    history = model.fit(features, keras.utils.to_categorical(labels, classes), epochs=epochs,
+                        batch_size=batch_size, validation_data=validation, verbose=0)
+    return model, history
+
+
+def train_linear(features, labels, kind='svm', seed=0):
+    """
+    :param features: matrix of training embeddings
+    :param labels: array of integer training labels
+    :param kind: string, 'svm' for a LinearSVC or 'logistic' for a
+                 logistic regression
+    :param seed: integer, seed of the solver
+    :returns: trained scikit-learn model
+    """
+
+    if kind == 'svm':
+        model = LinearSVC(random_state=seed)
+    elif kind == 'logistic':
+        model = LogisticRegression(max_iter=1000, random_state=seed)
+    else:
+        raise ValueError("kind must be 'svm' or 'logistic'")
+    return model.fit(features, labels)
+
+
+def predict(model, features):
+    """
+    :param model: model from train_head or train_linear
+    :param features: matrix of embeddings
+    :returns: array of predicted classes and array of confidences
+              (class probability, or SVM decision value)
+    """
+
+    if isinstance(model, keras.Model):
+        scores = model.predict(features, verbose=0)
+    elif hasattr(model, 'predict_proba'):
+        scores = model.predict_proba(features)
+    else:
+        scores = model.decision_function(features)
+        if scores.ndim == 1:
+            # Binary SVMs give a single decision value
+            scores = np.column_stack([-scores, scores])
+    predictions = scores.argmax(axis=1)
+    if not isinstance(model, keras.Model):
+        predictions = model.classes_[predictions]
+    return predictions, scores.max(axis=1)
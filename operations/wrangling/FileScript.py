@@ -13,12 +13,20 @@ within the Python environment you are running this script on.
 
 
 # Importing libraries
+import numpy as np
 import pandas as pd
 import panel as pn
 
+import sys
+sys.path.insert(1, '../../helpers')
+import panel_libs as panellibs
+
 # Loading extensions
 pn.extension()
 
+# Edit history of the file shown by view_data
+history = None
+
 
 def view_data(path):
     """
@@ -30,10 +38,7 @@ def view_data(path):
     :param link: string representing path to file
     :returns: data frame with editor widgets
     """
-            
-    # Reads in data 
-    data = extract_data(path)
-    
+
     # Row Selector widget
     row_selection = pn.widgets.IntSlider(name='Navigate Rows', 
                                          width=350, margin=(0,50,-15,0))
@@ -69,17 +74,12 @@ def view_data(path):
     saver = pn.widgets.Toggle(name='Finish & Save Data', button_type='danger', 
                               margin=(10, 0, 0, 55), width=200)
    
-    # Keeps track of last change to data frame in case of an undo
-    global header_vals
-    global change
-    header_vals = []
-    change = ''
-    
-    # Variables that help detect changes in headers
-    global started
-    global head_val
-    head_val = 1
-    started = False
+    # Records edits to the data frame, continuing the previous
+    # edits if the same file is viewed again
+    global history
+    if (history is None) or (history.path != path):
+        history = EditHistory(extract_data(path), path)
+    head_selection.value = history.head
 
     @pn.depends(row_selection, col_selection, 
                 radio_selection, dropper, 
@@ -105,52 +105,19 @@ def view_data(path):
         # value is changed. However, this is not limited to a user changing the
         # widgets, but also changed programmatically as well. This is done a
         # few times across this function which leads to redundant calls.
-        # These redundant calls can cause problems as they can reassign variables.
-        # Hence, you may see some extra variables to detect these redundant calls
-        # such as 'started' or 'head_val' to detect a change in the header selector.
-
-        # Checks for previous run of this function or change in data
-        global active_data
-        global updated_df
-        global stored_data
-        global previous_stored
-        global previous_df
-        global change
-        global started
-        global head_val
-        
-        if ('updated_df' in globals()) and (path == active_data):
-            df = updated_df.copy()
-        else:
-            active_data = path
-            #df = data
-            df = extract_data(path)
-            stored_data = df.copy()
-            previous_stored = stored_data.copy()
-            previous_df = df.copy()
-            updated_df = df.copy()
+        # Edits are only recorded when they differ from the current state
+        # of the history, so redundant calls leave it unchanged.
         
         # Checks for click on the undo button
         if back:
             undo.value = False
+            history.undo()
             
-            if change == '':
-                return updated_df.iloc[row:row+6, col:col+13]
+            # Restores the header selector of the previous state, the
+            # resulting call finds the header unchanged
+            head_selection.value = history.head
             
-            elif change == 'header':
-                change = 'skip'
-                if len(header_vals) > 1:
-                    head_selection.value = header_vals[-2]
-                else:
-                    head_selection.value = header_vals[0]
-                
-            elif change == 'axis':
-                stored_data = previous_stored.copy()
-            
-            change = ''
-            updated_df = previous_df.copy()
-            
-            return updated_df.iloc[row:row+6, col:col+13]
+            return history.view(row, col)
 
         # Instantiates data and enables widgets
         if radio == 'Columns':
@@ -159,45 +126,25 @@ def view_data(path):
         else:
             col_drop.disabled = True
             row_drop.disabled = False
-        row_selection.start, row_selection.end = 0, len(df) - 1
-        col_selection.start, col_selection.end = 0, len(df.columns)
+        row_selection.start, row_selection.end = 0, len(history) - 1
+        col_selection.start, col_selection.end = 0, len(history.columns)
 
         # Combines header rows and creates data frame with appropriate header
-        # Checks to see if header value changed
-        if ((head != head_val) or not started) and (change != 'skip'):
-            # Stores head values in case an undo is selected
-            change = 'header'
-            header_vals.append(head)
-            
-            head_rows = stored_data.iloc[0:head-1].T.reset_index().fillna('')
-            columns = head_rows.apply(lambda row: ' '.join(row.values.astype(str)), axis=1)
-
-            updated_df = stored_data.copy()
-            updated_df.columns = columns
-            updated_df = updated_df.iloc[head-1:]
+        if head != history.head:
+            history.set_header(head)
             
-            started = True
-            head_val = head
-            
-        col_drop.options = list(updated_df.columns)
+        col_drop.options = history.columns
 
         # Updates data frame when column/row is dropped
         if drop:
+            dropper.value = False
             if (row_drop.value == '') and (radio == 'Rows'):
-                dropper.value = False
-                return updated_df.iloc[row:row+6, col:col+13]
+                return history.view(row, col)
             
-            change = 'axis'
-            dropper.value = False
             if radio == 'Columns':
-                previous_df = updated_df.copy()
-                col_index = updated_df.columns.get_loc(col_drop.value)
-                updated_df = updated_df.drop(col_drop.value, axis=1)
-                previous_stored = stored_data.copy()
-                stored_data = stored_data.drop(stored_data.columns[col_index], axis=1)
-                dropper.value = False
+                history.drop_column(history.columns.index(col_drop.value))
             else:
-                poss_values = [str(x) for x in list(df.index)]
+                poss_values = history.labels()
                 
                 # Checks for range of values
                 if '-' in row_drop.value:
@@ -207,40 +154,28 @@ def view_data(path):
                     
                     for bound in [lower, upper]:
                         # Checks for invalid row number
-                        if (not bound.isdigit()) or (bound not in poss_values):
-                            dropper.value = False
-                            return updated_df.iloc[row:row+6, col:col+13]
+                        if (not bound.isdigit()) or (int(bound) not in poss_values):
+                            return history.view(row, col)
                     
                     # Removes range of values
-                    previous_df = updated_df.copy()
-                    lower_frame = updated_df[updated_df.index < int(lower)]
-                    upper_frame = updated_df[updated_df.index > int(upper)]
-                    updated_df = pd.concat([lower_frame, upper_frame])
-                    previous_stored = stored_data.copy()
-                    stored_lower_frame = stored_data[stored_data.index < int(lower)]
-                    stored_upper_frame = stored_data[stored_data.index > int(upper)]
-                    stored_data = pd.concat([stored_lower_frame, stored_upper_frame])
+                    history.drop_rows(int(lower), int(upper))
                     row_drop.value = ''
                   
                 else:    
                     # Checks for invalid row number
-                    if (not row_drop.value.isdigit()) or (row_drop.value not in poss_values):
-                        dropper.value = False
-                        return updated_df.iloc[row:row+6, col:col+13]
-
-                    previous_df = updated_df.copy()
-                    updated_df = updated_df.drop(int(row_drop.value))
-                    previous_stored = stored_data.copy()
-                    stored_data = stored_data.drop(int(row_drop.value))
+                    if (not row_drop.value.isdigit()) or (int(row_drop.value) not in poss_values):
+                        return history.view(row, col)
+
+                    history.drop_rows(int(row_drop.value), int(row_drop.value))
                     row_drop.value = ''
 
         # Saves data frame when user clicks save widget
         if save:
             global final_df
-            final_df = updated_df.reset_index(drop=True)
+            final_df = history.frame().reset_index(drop=True)
             saver.value = False
 
-        return updated_df.iloc[row:row+6, col:col+13]
+        return history.view(row, col)
 
     # Displays widgets
     navigators = pn.Row(row_selection, col_selection , margin=(30,0,0,10))
@@ -267,22 +202,137 @@ def extract_data(path):
     :returns: data frame of file
     """
 
-    # Reading file at path
-    if path.endswith(('.txt', 'tsv')):
-        try:
-            data = pd.read_csv(path, sep='\t', encoding="latin-1")
-        except UnicodeDecodeError:
-            data = pd.read_csv(path, sep='\t', encoding="ISO-8859-1")
-    elif path.endswith('.csv'):
-        try:
-            data = pd.read_csv(path, encoding="latin-1")
-        except UnicodeDecodeError:
-            data = pd.read_csv(path, encoding="ISO-8859-1")
-    else:
-        return None
+    # Reads through the shared survey cache, see panel_libs.extract_data
+    return panellibs.extract_data(path)
+
+
+def __getattr__(name):
+    """
+    Builds updated_df, the data frame edited in view_data,
+    from the edit history when it is accessed.
+    """
+    
+    if (name == 'updated_df') and (history is not None):
+        return history.frame()
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
+
+
+class EditHistory:
+    """
+    EditHistory records the edits made in view_data (dropped 
+    rows and columns and the number of header rows) without
+    copying the data frame.
+    
+    Each edit pushes the positions of the remaining rows and
+    columns onto a stack. Views of the edited data frame are 
+    taken from the original data frame with these positions,
+    and undoing an edit pops the stack.
+    
+    :param data: data frame
+    :param path: string representing path to file of data
+    """
+    
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        rows, cols = np.arange(data.shape[0]), np.arange(data.shape[1])
+        self.states = [(rows, cols, 1, self.header(rows, cols, 1))]
+        
+    @property
+    def head(self):
+        return self.states[-1][2]
+    
+    @property
+    def columns(self):
+        return self.states[-1][3]
+    
+    def __len__(self):
+        rows, _, head, _ = self.states[-1]
+        return max(len(rows) - (head - 1), 0)
+    
+    def header(self, rows, cols, head):
+        """
+        header combines the first head - 1 rows with
+        the column names into a single header.
+        
+        :returns: list of column names
+        """
+        
+        if len(cols) == 0:
+            return []
+        head_rows = self.data.iloc[rows[:head-1], cols].T.reset_index().fillna('')
+        return head_rows.apply(lambda row: ' '.join(row.values.astype(str)), axis=1).tolist()
     
-    cleaned_data = (data
-                    .dropna(axis=1, how='all')
-                    .dropna(axis=0, how='all'))
+    def push(self, rows=None, cols=None, head=None):
+        """
+        push records a new state, keeping the current 
+        rows, columns or header where none is given.
+        """
+        
+        last_rows, last_cols, last_head, _ = self.states[-1]
+        rows = last_rows if rows is None else rows
+        cols = last_cols if cols is None else cols
+        head = last_head if head is None else head
+        self.states.append((rows, cols, head, self.header(rows, cols, head)))
     
-    return cleaned_data
+    def set_header(self, head):
+        self.push(head=head)
+        
+    def drop_column(self, position):
+        """
+        :param position: integer, position of column in the edited data frame
+        """
+        
+        self.push(cols=np.delete(self.states[-1][1], position))
+        
+    def drop_rows(self, lower, upper):
+        """
+        drop_rows drops the rows with index labels from
+        lower to upper (inclusive).
+        """
+        
+        rows = self.states[-1][0]
+        labels = self.data.index[rows]
+        self.push(rows=rows[~((labels >= lower) & (labels <= upper))])
+        
+    def undo(self):
+        """
+        undo reverts the last edit, if any.
+        
+        :returns: bool whether an edit was reverted
+        """
+        
+        if len(self.states) == 1:
+            return False
+        self.states.pop()
+        return True
+    
+    def labels(self):
+        """
+        :returns: index labels of the rows of the edited data frame
+        """
+        
+        rows, _, head, _ = self.states[-1]
+        return self.data.index[rows[head-1:]]
+    
+    def view(self, row, col, num_rows=6, num_cols=13):
+        """
+        view returns a slice of the edited data frame, only 
+        reading the cells in the slice.
+        
+        :param row: integer, first row of the slice
+        :param col: integer, first column of the slice
+        :returns: data frame
+        """
+        
+        rows, cols, head, columns = self.states[-1]
+        view = self.data.iloc[rows[head-1:][row:row+num_rows], cols[col:col+num_cols]]
+        return view.set_axis(columns[col:col+num_cols], axis=1)
+    
+    def frame(self):
+        """
+        :returns: edited data frame
+        """
+        
+        rows, cols, head, columns = self.states[-1]
+        return self.data.iloc[rows[head-1:], cols].set_axis(columns, axis=1)
@@ -11,6 +11,9 @@ QualifierSuave must be in the same directory and run prior to
 running this script. Please refer to QualifierSuave for information
 on running it.
 
+Geocoding itself (backends, caching and concurrency) is done
+by GeocoderSuave.
+
 This script requires that requests, pandas, json, and panel 
 be installed within the Python environment you are running 
 this script on.
@@ -19,9 +22,9 @@ this script on.
 
 # Importing required scripts
 import QualifierSuave as ql
+import GeocoderSuave as gc
 
 # Importing libraries
-import requests
 import pandas as pd
 import json
 import panel as pn
@@ -35,13 +38,15 @@ import panel_libs as panellibs
 pn.extension()
 
 
-def geocoder(options):
+def geocoder(options, backend=None):
     """
     geocoder allows users to select a column to geocode
     and produce latitude/longitude columns for those
     respective locations.
     
     :param options: Array of columns that can be geocoded
+    :param backend: GeocoderSuave backend, defaults to the
+                    data science tool kit
     :returns: widgets to select column to geocode
     """
     # Geocode Column Selector widget
@@ -55,6 +60,9 @@ def geocoder(options):
     global progress_geocode
     progress_geocode = pn.pane.Markdown('')
     
+    # Data frame display, reused across updates
+    viewer = panellibs.DataViewer()
+    
     # Stores geocoded and non-geocoded values
     global is_geocoded
     global not_geocoded
@@ -75,7 +83,7 @@ def geocoder(options):
         
         if geo_select.value == 'None':
             geo_button.value = False
-            return panellibs.slider(updated_df)
+            return panellibs.slider(updated_df, viewer)
         
         if geo_button.value == True:
             # Temporarily disables geocode button
@@ -87,22 +95,25 @@ def geocoder(options):
         for col in updated_df.columns:
             if '#number#hidden' in col:
                 error = '#####Coordinate columns already exist.'
-                return pn.Column(error, panellibs.slider(updated_df))
+                return pn.Column(error, panellibs.slider(updated_df, viewer))
         
-        # Geocodes and stores latitude/longitude for each address
-        unique_vals = updated_df[geo_select.value].dropna().unique()
-        coords = pd.Series(unique_vals).apply(get_coords)
+        # Geocodes and stores latitude/longitude for each unique address
+        address_dict, failed = gc.geocode_all(updated_df[geo_select.value], backend=backend,
+                                              progress=report_progress)
         
-        address_dict = {}
-        coords.apply(lambda address: address_dict.update(address))
+        for address, coords in address_dict.items():
+            if coords is None:
+                not_geocoded.append(address)
+            else:
+                is_geocoded.append(address)
+        not_geocoded.extend(failed)
         
         # Creating latitude/longitude columns
+        found = {address: coords for address, coords in address_dict.items() if coords is not None}
         updated_df['latitude#number#hidden'] = (updated_df[geo_select.value]
-                                                .map(address_dict)
-                                                .apply(lambda x: x[0] if type(x) == list else None))
+                                                .map({address: coords[0] for address, coords in found.items()}))
         updated_df['longitude#number#hidden'] = (updated_df[geo_select.value]
-                                                 .map(address_dict)
-                                                 .apply(lambda x: x[1] if type(x) == list else None))
+                                                 .map({address: coords[1] for address, coords in found.items()}))
 
         progress_geocode.object = ''
         
@@ -111,7 +122,7 @@ def geocoder(options):
         non_geocoded_vals = pn.widgets.Select(name='Non Geocoded Values', options=not_geocoded, width=200)
         full_report = pn.Row(report_message, geocoded_vals, non_geocoded_vals, margin=(5,0,20,0))
                         
-        row_slider = panellibs.slider(updated_df)
+        row_slider = panellibs.slider(updated_df, viewer)
         full_display = pn.Column(full_report, row_slider)
 
         return full_display
@@ -122,50 +133,27 @@ def geocoder(options):
     return widgets
 
 
-def get_coords(address):
+def report_progress(batch):
     """
-    get_coords uses the data science tool kit to geocode
-    addresses.
+    report_progress shows the latest batch of geocoded
+    addresses in the geocoder progress widget.
     
-    :param address: string representing location
-    :returns: dictionary with keys as addresses and
-              values as latitude/longitude coordinates
+    :param batch: list of (address, coordinates) pairs
     """
         
     # Base progress menu for geocoder
     base_progress = ('| Placename | Status | Latitude | Longitude |' + 
                      '\n|:---------:|:-------:|:--------:|:---------:|')
     
-    if pd.isnull(address):
-        progress_geocode.object = base_progress + '\n| Null | Failed | Null | Null |'
-        return 
-    
-    # dstk API url
-    partial_url = "http://www.datasciencetoolkit.org/maps/api/geocode/json?sensor=false&address="
-    
-    # Reformats string to work with dstk API
-    address_reformat = address.replace(" ", "+").replace("'", "")
-    
-    # Geocodes address
-    response = requests.get(partial_url+address_reformat).json()
-    
-    # Handles case of no results/invalid address
-    if response['status'] == 'ZERO_RESULTS':
-        not_geocoded.append(address)
-        progress_geocode.object = base_progress + '\n| ' + address + ' | Failed | Null | Null |'
-        return {address: [None, None]}
+    rows = []
+    for address, coords in batch[-10:]:
+        if coords is None:
+            rows.append('| ' + str(address) + ' | Failed | Null | Null |')
+        else:
+            rows.append('| ' + str(address) + ' | Geocoded | ' + 
+                        str(coords[0]) + ' | ' + str(coords[1]) + ' |')
     
-    # Extracts result
-    coords = response['results'][0]['geometry']['location']
-    lat = coords['lat']
-    lon = coords['lng']
-    
-    progress_geocode.object = base_progress + ('\n| ' + address + ' | Geocoded | ' + 
-                                               str(lat) + ' | ' + str(lon) + ' |')
-    
-    is_geocoded.append(address)
-    
-    return {address: [lat, lon]}
+    progress_geocode.object = base_progress + '\n' + '\n'.join(rows)
 
 
 def json_to_geometry(file_value, options):
@@ -184,8 +172,11 @@ def json_to_geometry(file_value, options):
     # Column Selector widget
     column_selector = pn.widgets.Select(name='Select Column to Match', options=['None']+options)
 
+    # Parses the GeoJSON file once for every property
+    geo_index = GeoJSONIndex(file_value)
+
     # Geojson Property Selector widget
-    json_props = list(json.loads(file_value)['features'][0]['properties'].keys())
+    json_props = geo_index.properties
     prop_selector = pn.widgets.Select(name='Select GeoJSON Property to Match', options=['None']+json_props)
 
     # Geometry Generator button
@@ -200,7 +191,9 @@ def json_to_geometry(file_value, options):
     no_geom = []
 
     df = ql.updated_df
-    geometries = {}
+    
+    # Data frame display, reused across updates
+    viewer = panellibs.DataViewer()
 
     @pn.depends(column_selector.param.value, prop_selector.param.value)
     def display_match(col, prop):
@@ -218,42 +211,8 @@ def json_to_geometry(file_value, options):
         if (col == 'None') or (prop == 'None'):
             return
 
-        # Extracts all property values from json and geometries for future use
-        prop_vals = []
-
-        for feature in json.loads(file_value)['features']:
-            geometry = feature['geometry']
-
-            # Ensures feature has a geometry
-            if len(geometry['coordinates']) > 0:
-
-                # Stores property value
-                properties = feature['properties']
-                prop_val = properties[prop]
-                prop_vals.append(prop_val.lower())
-
-                # Stores geometries in WKT format
-                geom_type = geometry['type'].upper()
-                cleaned_coords = (str(geometry['coordinates'])[1:-1]
-                                  .replace(',', ' ').replace('  ', ' ')
-                                  .replace('] [', ', ').replace(']  [', ', ')
-                                  .replace('[','(').replace(']',')'))
-                geometries[prop_val.lower()] = geom_type+' '+cleaned_coords
-
-        # Determines which column values are existing property values
-        col_vals = list(df[col].str.lower().unique())
-
-        valid_col_vals = []
-        for col_val in col_vals:
-            if col_val in prop_vals:
-                valid_col_vals.append(col_val)
-
-        # Determines number of column values that are a match
-        value_counts = df[col].str.lower().value_counts()
-
-        match = 0
-        for col_name in valid_col_vals:
-            match += value_counts[col_name]
+        # Determines number of column values that are existing property values
+        match = int(df[col].str.lower().isin(geo_index.values(prop)).sum())
 
         # Formualtes response for user
         response = ("**"+str(match)+"** of **"+str(len(df))+
@@ -293,10 +252,10 @@ def json_to_geometry(file_value, options):
             if pd.isnull(string):
                 progress_json.object = base_progress + '\n|  Null  | Failed |'
                 return None
-            elif string.lower() in geometries.keys():
+            elif string.lower() in geo_index.values(prop_selector.value):
                 progress_json.object = base_progress + '\n| ' + string + ' | Success |'
                 with_geom.append(string)
-                return geometries[string.lower()]
+                return geo_index.wkt(prop_selector.value, string.lower())
             else:
                 progress_json.object = base_progress + '\n| ' + string + ' | Failed |'
                 no_geom.append(string)
@@ -313,7 +272,7 @@ def json_to_geometry(file_value, options):
                     generator.disabled = True
                     message = pn.pane.Markdown('Geometry column already exists. Either remove ' + 
                                                'column above or continue.', margin=(-25,0,15,0))
-                    return pn.Column(message, panellibs.slider(df))
+                    return pn.Column(message, panellibs.slider(df, viewer))
             
             # Generates geometries
             unique_vals = df[column_selector.value].unique()
@@ -329,7 +288,7 @@ def json_to_geometry(file_value, options):
             non_geom_vals = pn.widgets.Select(name='No Geometry', options=no_geom, width=200)
             full_report = pn.Row(report_message, geom_vals, non_geom_vals, margin=(-20,0,20,0))
                         
-            row_slider = panellibs.slider(df)
+            row_slider = panellibs.slider(df, viewer)
             full_display = pn.Column(full_report, row_slider)
             
             return full_display   
@@ -343,4 +302,96 @@ def json_to_geometry(file_value, options):
     geom_display = pn.Column(top_panel, geom_df)
     
     return geom_display
-    
\ No newline at end of file
+
+
+class GeoJSONIndex:
+    """
+    GeoJSONIndex parses a GeoJSON file once and indexes the
+    geometry of every feature by the (lower-cased) value of
+    each of its properties. Features without a geometry are
+    skipped. WKT strings are produced when first requested.
+    
+    :param file_value: contents of a GeoJSON file
+    """
+    
+    def __init__(self, file_value):
+        self.geometries = []
+        self.index = {}
+        self.wkt_cache = {}
+        
+        for feature in json.loads(file_value)['features']:
+            geometry = feature.get('geometry')
+            
+            # Ensures feature has a geometry
+            if not geometry or not (geometry.get('coordinates') or geometry.get('geometries')):
+                continue
+            
+            self.geometries.append(geometry)
+            position = len(self.geometries) - 1
+            for prop, prop_val in (feature.get('properties') or {}).items():
+                if prop_val is None:
+                    continue
+                # Later features with the same value take precedence
+                self.index.setdefault(prop, {})[str(prop_val).lower()] = position
+        
+        self.properties = list(self.index.keys())
+    
+    def values(self, prop):
+        """
+        values returns the lower-cased values of a property
+        that have a geometry.
+        
+        :param prop: string, GeoJSON property
+        :returns: dictionary keys of property values
+        """
+        
+        return self.index.get(prop, {}).keys()
+    
+    def wkt(self, prop, value):
+        """
+        wkt returns the geometry of the feature whose property
+        has the given (lower-cased) value, in WKT format.
+        
+        :param prop: string, GeoJSON property
+        :param value: string, lower-cased property value
+        :returns: string in WKT format
+        """
+        
+        position = self.index[prop][value]
+        if position not in self.wkt_cache:
+            self.wkt_cache[position] = to_wkt(self.geometries[position])
+        return self.wkt_cache[position]
+
+
+def to_wkt(geometry):
+    """
+    to_wkt converts a GeoJSON geometry to WKT format, keeping
+    every ring of polygons (holes) and every part of multi
+    geometries.
+    
+    :param geometry: dictionary, GeoJSON geometry
+    :returns: string in WKT format
+    
+    :Example:
+    >>> to_wkt({'type': 'Point', 'coordinates': [1, 2]})
+    'POINT (1 2)'
+    >>> to_wkt({'type': 'MultiPolygon', 'coordinates': [[[[0, 0], [1, 0], [1, 1], [0, 0]]]]})
+    'MULTIPOLYGON (((0 0, 1 0, 1 1, 0 0)))'
+    """
+    
+    geom_type = geometry['type']
+    if geom_type == 'GeometryCollection':
+        return 'GEOMETRYCOLLECTION (' + ', '.join(to_wkt(g) for g in geometry['geometries']) + ')'
+    
+    # Levels of nesting of each geometry's coordinate lists
+    depth = {'Point': 0, 'LineString': 1, 'MultiPoint': 1, 'Polygon': 2,
+             'MultiLineString': 2, 'MultiPolygon': 3}[geom_type]
+    
+    def serialize(coords, level):
+        if level == 0:
+            return ' '.join(str(c) for c in coords)
+        if level == 1:
+            return ', '.join(serialize(point, 0) for point in coords)
+        return ', '.join('(' + serialize(part, level - 1) + ')' for part in coords)
+    
+    return geom_type.upper() + ' (' + serialize(geometry['coordinates'], depth) + ')'
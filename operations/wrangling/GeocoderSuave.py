@@ -0,0 +1,257 @@
+""" Geocoding Backends and Cache
+
+This script geocodes place names to latitude/longitude coordinates
+for GeoToolsSuave. Addresses are deduplicated, looked up in a
+persistent on-disk cache, and only the remaining ones are sent to a
+geocoding backend, several at a time.
+
+Two backends are provided: DSTKBackend queries the data science
+tool kit API and GazetteerBackend looks places up in a local CSV
+file (useful offline). Other services can be added by subclassing
+GeocoderBackend.
+
+To achieve this functionality, simply run geocode_all() with a list
+of addresses.
+
+This script requires that requests and pandas be installed within
+the Python environment you are running this script on.
+"""
+
+
+# Importing libraries
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Default location of the geocode cache, shared by all surveys
+CACHE_PATH = '../../temp_csvs/geocode_cache.db'
+
+
+class GeocoderBackend:
+    """
+    GeocoderBackend is the interface of geocoding services.
+
+    Subclasses implement geocode(), returning a (lat, lon) tuple,
+    or None when the service has no result for the address. Errors
+    (e.g. network failures) should be raised so that the address is
+    not cached as missing.
+    """
+
+    # Identifies the backend in the cache
+    name = 'backend'
+
+    def geocode(self, address):
+        raise NotImplementedError
+
+
+class RateLimiter:
+    """
+    RateLimiter spaces out calls shared across threads so that
+    at most rate calls per second are made.
+
+    :param rate: float, maximum calls per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_call = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DSTKBackend(GeocoderBackend):
+    """
+    DSTKBackend geocodes addresses with the data science tool kit
+    API, reusing pooled connections, retrying failed requests with
+    backoff and limiting the request rate.
+
+    :param rate: float, maximum requests per second
+    :param timeout: float, seconds to wait for a response
+    :param retries: integer, retries of failed requests
+    :param pool_size: integer, maximum open connections
+    """
+
+    name = 'dstk'
+    url = 'http://www.datasciencetoolkit.org/maps/api/geocode/json'
+
+    def __init__(self, rate=10, timeout=10, retries=3, pool_size=8):
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        retry = Retry(total=retries, backoff_factor=0.5,
+                      status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def geocode(self, address):
+        self.limiter.wait()
+        response = self.session.get(self.url, timeout=self.timeout,
+                                    params={'sensor': 'false',
+                                            'address': address.replace("'", "")})
+        response.raise_for_status()
+        response = response.json()
+
+        # Handles case of no results/invalid address
+        if (response['status'] == 'ZERO_RESULTS') or (len(response['results']) == 0):
+            return None
+
+        coords = response['results'][0]['geometry']['location']
+        return coords['lat'], coords['lng']
+
+
+class GazetteerBackend(GeocoderBackend):
+    """
+    GazetteerBackend looks addresses up in a CSV file of place
+    names and coordinates. Matching ignores case and surrounding
+    whitespace.
+
+    :param path: string representing path to the gazetteer CSV
+    :param name_col: string, column with place names
+    :param lat_col: string, column with latitudes
+    :param lon_col: string, column with longitudes
+    """
+
+    name = 'gazetteer'
+
+    def __init__(self, path, name_col='placename', lat_col='latitude', lon_col='longitude'):
+        places = pd.read_csv(path, usecols=[name_col, lat_col, lon_col]).dropna()
+        keys = places[name_col].astype(str).str.strip().str.lower()
+        self.places = dict(zip(keys, zip(places[lat_col].astype(float),
+                                         places[lon_col].astype(float))))
+        self.name = 'gazetteer:' + os.path.abspath(path)
+
+    def geocode(self, address):
+        return self.places.get(address.strip().lower())
+
+
+class GeocodeCache:
+    """
+    GeocodeCache stores geocoding results on disk (SQLite), per
+    backend. Addresses without a result are stored too, with
+    missing coordinates, so they are not requested again.
+
+    The cache should only be used from the thread that created it.
+
+    :param path: string representing path to the cache file
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS geocodes ' +
+                                '(backend TEXT, address TEXT, lat REAL, lon REAL, ' +
+                                'PRIMARY KEY (backend, address))')
+        self.connection.commit()
+
+    def get_many(self, backend, addresses):
+        """
+        get_many returns the cached results of the given addresses.
+
+        :param backend: string, name of the backend
+        :param addresses: list of strings
+        :returns: dictionary of address to (lat, lon) or None
+        """
+
+        found = {}
+        addresses = list(addresses)
+        # Stays under SQLite's limit on query parameters
+        for start in range(0, len(addresses), 500):
+            batch = addresses[start:start+500]
+            query = ('SELECT address, lat, lon FROM geocodes WHERE backend = ? ' +
+                     'AND address IN (' + ','.join('?' * len(batch)) + ')')
+            for address, lat, lon in self.connection.execute(query, [backend] + batch):
+                found[address] = None if lat is None else (lat, lon)
+        return found
+
+    def put_many(self, backend, results):
+        """
+        put_many stores geocoding results.
+
+        :param backend: string, name of the backend
+        :param results: dictionary of address to (lat, lon) or None
+        """
+
+        rows = [(backend, address) + (coords if coords is not None else (None, None))
+                for address, coords in results.items()]
+        self.connection.executemany('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)', rows)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def geocode_all(addresses, backend=None, cache=None, max_workers=8,
+                progress=None, batch_size=50):
+    """
+    geocode_all geocodes every distinct address, serving repeated
+    addresses from the cache and sending the others to the backend
+    from a pool of threads.
+
+    :param addresses: iterable of strings
+    :param backend: GeocoderBackend, defaults to DSTKBackend
+    :param cache: GeocodeCache, defaults to the shared cache file
+    :param max_workers: integer, concurrent requests
+    :param progress: function called with a list of (address, coords)
+                     every batch_size geocoded addresses
+    :param batch_size: integer, number of results per progress call
+    :returns: dictionary of address to (lat, lon) or None, and a
+              list of addresses that failed (e.g. network errors)
+    """
+
+    if backend is None:
+        backend = DSTKBackend(pool_size=max_workers)
+    own_cache = cache is None
+    if own_cache:
+        cache = GeocodeCache()
+
+    unique = list(pd.Series(list(addresses), dtype=object).dropna().unique())
+    results = cache.get_many(backend.name, unique)
+    missing = [address for address in unique if address not in results]
+    errors = []
+
+    # Results are stored and reported in batches from this thread only
+    batch = {}
+    def flush():
+        cache.put_many(backend.name, batch)
+        if progress is not None:
+            progress(list(batch.items()))
+        batch.clear()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(backend.geocode, address): address for address in missing}
+        for future in as_completed(futures):
+            address = futures[future]
+            try:
+                coords = future.result()
+            except Exception:
+                errors.append(address)
+                continue
+            results[address] = coords
+            batch[address] = coords
+            if len(batch) >= batch_size:
+                flush()
+    if batch:
+        flush()
+
+    if own_cache:
+        cache.close()
+
+    return results, errors
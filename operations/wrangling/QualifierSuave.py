@@ -6,6 +6,9 @@ to edit the qualifiers if needed.
 
 To achieve this functionality, simply run qualifier_editor().
 
+Qualifiers can also be inferred without the editor with 
+QualifierInference(), or for many files at once with infer_files().
+
 ZipScript must be in the same directory and run prior to
 running this script. Please refer to ZipScript for information
 on running it.
@@ -20,7 +23,10 @@ this script on.
 import FileScript as fs
 
 # Importing libraries
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 from dateutil.parser import parse
 import panel as pn
@@ -29,7 +35,7 @@ import panel as pn
 pn.extension()
 
 
-def qualifier_editor():
+def qualifier_editor(sample_size=None, min_confidence=0.99, chunks=None):
     """
     Main function
     
@@ -37,24 +43,27 @@ def qualifier_editor():
     to alter data frame qualifiers through the use of widgets.
     Displays the updated data frame when edits are made.
     
+    When sample_size is given, qualifiers are suggested from a
+    sample of each column's values (see find_cols) and their
+    confidence scores are displayed under the editor.
+    
+    :param sample_size: integer, number of values to sample
+    :param min_confidence: float, confidence below which every
+                           value is tested
+    :param chunks: SurveyChunks of the survey file read as strings,
+                   to infer qualifiers from the whole file chunk by
+                   chunk (see generate_qualifiers)
     :returns: data frame with qualifiers and editor widgets 
     """ 
     
-    # Clears out stored column names if qualifier_editor was previously run.
-    if ('stored_quant' in globals()) and ('stored_text' in globals()):
-        global stored_quant
-        global stored_text
-        stored_quant=[]
-        stored_text=[]
-    
-    # Produces data frame with column qualifiers
-    df = generate_qualifiers()
-    
-    # Checks if qualifier_editor was previously run. If so,
-    # instantiates previous data frame with new df above.
-    if 'updated_df' in globals():
-        global updated_df
-        updated_df = df
+    # Produces data frame with column qualifiers, replacing
+    # the results of previous runs
+    global updated_df
+    global stored_quant
+    global stored_text
+    global confidence_scores
+    df, stored_quant, stored_text, confidence_scores = generate_qualifiers(sample_size, min_confidence, chunks)
+    updated_df = df.copy()
         
     # Column Selector widget
     col_select = pn.widgets.IntSlider(name='Navigate Columns', end=len(df.columns), width=930)
@@ -107,10 +116,7 @@ def qualifier_editor():
         
         updater.value = False
         
-        # Checks for previous runs of this function
-        if 'updated_df' not in globals():
-            global updated_df
-            updated_df = df.copy()
+        global updated_df
         
         selected = var_select.value.copy()
         
@@ -226,83 +232,313 @@ def qualifier_editor():
     left_edit = pn.Column(var_select, css_classes=['widget-box'], margin=(0,10,0,0))
     full_edit = pn.Row(left_edit, right_edit, margin=(20,0,0,0))
     full_widget = pn.Column(col_select, pn.panel(update_trigger, width=930), full_edit, pn.panel(variable_rename), pn.panel(combo_trigger), width=930).servable()
+    
+    # Displays confidence of the suggested qualifiers
+    if (sample_size is not None) and confidence_scores:
+        table = '| Variable | Confidence |\n|:---|---:|\n'
+        table += ''.join('| ' + col + ' | ' + format(score, '.3f') + ' |\n'
+                         for col, score in confidence_scores.items())
+        full_widget.append(pn.pane.Markdown('##### Qualifier Confidence\n' + table, margin=(10,0,0,10)))
 
     return full_widget
 
 
-# Store names of numerical and string column types
-# as determined by determine_type
-quant_cols, text_cols = [], []
-
-# Store names of numerical and string column types
-# after quant_cols/text_cols refreshed
+# Results of the qualifier editor: data frame with qualifiers and
+# names of its numerical and string columns (read by GeoToolsSuave,
+# StringImageSuave and the notebooks), and confidence scores of the
+# suggested qualifiers
+updated_df = None
 stored_quant, stored_text = [], []
+confidence_scores = {}
+
+# Qualifiers recognized in column names
+qualifier_names = ('#name', '#img', '#href', '#number', '#link',
+                   '#ordinal', '#textlocation', '#multi', '#info', 
+                   '#date', '#long', '#hidden', '#hiddenmore')
 
-def generate_qualifiers():
+
+def generate_qualifiers(sample_size=None, min_confidence=0.99, chunks=None):
     """
     Helper function for qualifier_editor
     
     generate_qualifiers produces and applies qualifiers
-    to the data frame generated from ZipScript.
+    to the data frame generated from FileScript.
+    
+    When chunks of the survey file are given, the types and
+    qualifiers of its columns are inferred from the whole file
+    one chunk at a time, and applied to the columns of the data
+    frame with the same names. Columns renamed in FileScript 
+    are inferred from the data frame.
     
-    :returns: data frame with qualifiers
+    :param sample_size: integer, number of values to sample
+                        (see find_cols), None to test all values
+    :param min_confidence: float, confidence below which every
+                           value is tested
+    :param chunks: SurveyChunks of the survey file read as strings
+    :returns: data frame with qualifiers, lists of numerical and 
+              string column names and dictionary of confidence
+              scores (see QualifierInference.infer)
     """
     
-    global stored_quant
-    global stored_text
+    inference = QualifierInference(sample_size, min_confidence)
+    data = fs.final_df
+    if chunks is None:
+        return inference.infer(data)
     
+    qualified, stored_quant, stored_text, confidence = inference.infer(chunks)
+    names = dict(zip(chunks.columns, next(iter(qualified)).columns))
     
-    # Determines proper data type for each column
-    df = fs.final_df.apply(determine_type, axis=0)
+    # Converts numerical columns as infer would
+    known = [col for col in data.columns if col in names]
+    df = data.copy()
+    for col in known:
+        if names[col] in stored_quant:
+            df[col] = determine_type(df[col])[0]
     
-    num_cols = quant_cols
-    str_cols = text_cols
+    rest = data.drop(columns=known)
+    rest_df, rest_quant, _, rest_confidence = inference.infer(rest)
+    for col, new_col in zip(rest.columns, rest_df.columns):
+        df[col] = rest_df[new_col]
+        names[col] = new_col
+    df = df.rename(columns=names)
     
-    # Checks if column names already contain qualifiers
-    qualifiers = ('#name', '#img', '#href', '#number', '#link',
-                  '#ordinal', '#textlocation', '#multi', '#info', 
-                  '#date', '#long', '#hidden', '#hiddenmore')
+    quant = set(stored_quant).union(rest_quant)
+    stored_quant = [col for col in df.columns if col in quant]
+    stored_text = [col for col in df.columns if col not in quant]
+    confidence = {col: score for col, score in {**confidence, **rest_confidence}.items()
+                  if col in df.columns}
+    return df, stored_quant, stored_text, confidence
+
+
+class QualifierInference:
+    """
+    QualifierInference suggests qualifiers for the columns of 
+    a data frame. It only holds its settings and returns all of
+    its results, so a single instance can qualify any number of
+    surveys, including from several threads or processes.
     
-    for col_name in fs.final_df.columns:
-        if col_name.endswith(qualifiers):
-            
-            for col in fs.final_df.columns:
-                # Stores qualifier type for future use
-                if col in quant_cols:
-                    stored_quant.append(col)
-                else:
-                    stored_text.append(col) 
-                    
-            refresh()
-                
-            return fs.final_df
-    
-    # Determines proper qualifier for each column
-    link_cols = find_cols(df, str_cols, has_link)
-    date_cols = find_cols(df, list(set(str_cols).difference(link_cols)), has_date)
-    geom_cols = find_cols(df, list(set(str_cols).difference(date_cols)), None)
-    long_cols = find_cols(df, list(set(str_cols).difference(geom_cols)), has_long)
-    coord_cols = find_cols(df, num_cols, None)
-    str_cols = list(set(str_cols).difference(link_cols+date_cols+long_cols+coord_cols))
-    num_cols = list(set(num_cols).difference(coord_cols))
-
-    # Applies qualifiers to data frame
-    qualifier_dict = {'#number':num_cols, '#link':link_cols, 
-                      '#date':date_cols, '#long':long_cols, 
-                      '#hiddenmore': geom_cols,'#number#hidden': coord_cols}
-    df = add_qualifiers(df, qualifier_dict)
-    
-    # Stores qualifier type for future use
-    for col_name in df.columns:     
+    :param sample_size: integer, number of values to sample
+                        (see find_cols), None to test all values
+    :param min_confidence: float, confidence below which every
+                           value is tested
+    """
+    
+    def __init__(self, sample_size=None, min_confidence=0.99):
+        self.sample_size = sample_size
+        self.min_confidence = min_confidence
+        
+    def infer(self, data):
+        """
+        infer determines the type of each column of a data
+        frame and applies the most appropriate qualifiers.
+        Data frames whose column names already contain
+        qualifiers are returned as is.
+        
+        Surveys too large for memory can be given as chunks
+        (see infer_chunked).
+        
+        :param data: data frame, or SurveyChunks read as strings
+        :returns: data frame with qualifiers, lists of numerical
+                  and string column names (with qualifiers) and
+                  dictionary of column names (with qualifiers) to
+                  confidence scores of the suggested qualifiers
+        """
+        
+        if not isinstance(data, pd.DataFrame):
+            return self.infer_chunked(data)
+        
+        # Determines proper data type for each column
+        quant_cols, text_cols = [], []
+        columns = []
+        for i in range(data.shape[1]):
+            col, typ = determine_type(data.iloc[:, i])
+            columns.append(col)
+            (quant_cols if typ == 'float' else text_cols).append(data.columns[i])
+        df = pd.concat(columns, axis=1) if columns else data.copy()
+        df.columns = data.columns
+        
+        # Checks if column names already contain qualifiers
+        if any(str(col_name).endswith(qualifier_names) for col_name in data.columns):
+            stored_quant = [col for col in data.columns if col in quant_cols]
+            stored_text = [col for col in data.columns if col not in quant_cols]
+            return data, stored_quant, stored_text, {}
+        
+        qualifier_dict, confidence = self.find_qualifiers(df, quant_cols, text_cols)
+        df = add_qualifiers(df, qualifier_dict)
+        stored_quant, stored_text = sort_columns(df.columns, quant_cols)
+        
+        return df, stored_quant, stored_text, confidence
+    
+    def infer_chunked(self, chunks):
+        """
+        infer_chunked is infer for surveys read in chunks. 
+        Column types are determined over every chunk (see
+        determine_types_chunked) and qualifiers from the unique
+        values of the string columns across chunks.
+        
+        :param chunks: SurveyChunks read as strings (or any
+                       iterable of data frames with the same 
+                       columns that can be iterated repeatedly)
+        :returns: generator of data frames with qualifiers, and
+                  the other results of infer
+        """
+        
+        quant_cols, text_cols = determine_types_chunked(chunks)
+        columns = quant_cols + text_cols
+        
+        # Checks if column names already contain qualifiers
+        if any(str(col_name).endswith(qualifier_names) for col_name in columns):
+            return chunks, quant_cols, text_cols, {}
+        
+        # Unique values are all that find_cols tests
+        unique_vals = {}
+        for chunk in chunks:
+            for name in text_cols:
+                values = chunk[name].dropna().unique()
+                unique_vals[name] = (pd.unique(np.concatenate([unique_vals[name], values]))
+                                     if name in unique_vals else values)
+        df = pd.DataFrame({name: pd.Series(unique_vals.get(name, []), dtype=object) 
+                           for name in columns})
+        
+        qualifier_dict, confidence = self.find_qualifiers(df, quant_cols, text_cols)
+        stored_quant, stored_text = sort_columns(add_qualifiers(df, qualifier_dict).columns, quant_cols)
+        
+        def qualified():
+            for chunk in chunks:
+                chunk = chunk.copy()
+                for name in quant_cols:
+                    chunk[name] = determine_type(chunk[name])[0]
+                yield add_qualifiers(chunk, qualifier_dict)
+        
+        return qualified(), stored_quant, stored_text, confidence
+    
+    def find_qualifiers(self, df, quant_cols, text_cols):
+        """
+        Helper function for infer and infer_chunked
+        
+        :param df: data frame with converted columns
+        :param quant_cols: list of numerical column names
+        :param text_cols: list of string column names
+        :returns: dictionary of qualifiers to column names (see
+                  add_qualifiers) and dictionary of column names
+                  (with qualifiers) to confidence scores
+        """
+        
+        # Determines proper qualifier for each column
+        sample_size, min_confidence = self.sample_size, self.min_confidence
+        num_cols, str_cols = quant_cols, text_cols
+        link_scores, date_scores, long_scores = {}, {}, {}
+        link_cols = find_cols(df, str_cols, has_link, sample_size, min_confidence, link_scores)
+        date_cols = find_cols(df, list(set(str_cols).difference(link_cols)), has_date, 
+                              sample_size, min_confidence, date_scores)
+        geom_cols = find_cols(df, list(set(str_cols).difference(date_cols)), None, 
+                              quant_cols=quant_cols)
+        long_cols = find_cols(df, list(set(str_cols).difference(geom_cols)), has_long, 
+                              sample_size, min_confidence, long_scores)
+        coord_cols = find_cols(df, num_cols, None, quant_cols=quant_cols)
+        num_cols = list(set(num_cols).difference(coord_cols))
+
+        # Applies qualifiers to data frame
+        qualifier_dict = {'#number':num_cols, '#link':link_cols, 
+                          '#date':date_cols, '#long':long_cols, 
+                          '#hiddenmore': geom_cols,'#number#hidden': coord_cols}
+        columns = add_qualifiers(df.iloc[:0], qualifier_dict).columns
+        
+        # Columns keep the first qualifier they were given (see add_qualifiers)
+        confidence = {}
+        for qualifier, scores in [('#link', link_scores), ('#date', date_scores), ('#long', long_scores)]:
+            for col, score in scores.items():
+                if col + qualifier in columns:
+                    confidence[col + qualifier] = score
+        
+        return qualifier_dict, confidence
+
+
+def sort_columns(columns, quant_cols):
+    """
+    Helper function for QualifierInference
+    
+    :param columns: column names with qualifiers
+    :param quant_cols: list of numerical column names
+    :returns: lists of numerical and string column names
+              (with qualifiers)
+    """
+    
+    # Sorts columns with qualifiers by type
+    stored_quant, stored_text = [], []
+    for col_name in columns:     
         no_qual = col_name.split('#')[0]
         if no_qual in quant_cols:
             stored_quant.append(col_name)
         else:
             stored_text.append(col_name)  
-            
-    refresh()
+    
+    return stored_quant, stored_text
+    
+
+def infer_file(path, sample_size=None, min_confidence=0.99, out_dir=None):
+    """
+    Helper function for infer_files
+    
+    infer_file reads a survey file (see FileScript.extract_data)
+    and suggests qualifiers for its columns.
+    
+    :param path: string representing path to file
+    :param sample_size: integer, number of values to sample
+    :param min_confidence: float, confidence below which every
+                           value is tested
+    :param out_dir: string, directory to save the qualified
+                    survey to as CSV, None to not save it
+    :returns: dictionary of column names to column names with 
+              qualifiers and dictionary of confidence scores
+    """
+    
+    data = fs.extract_data(path)
+    if data is None:
+        raise ValueError('Unsupported file type: ' + path)
+    
+    df, _, _, confidence = QualifierInference(sample_size, min_confidence).infer(data)
+    
+    if out_dir is not None:
+        name = os.path.splitext(os.path.basename(path))[0] + '.csv'
+        df.to_csv(os.path.join(out_dir, name), index=False)
+    
+    return dict(zip(data.columns, df.columns)), confidence
 
-    return df
+
+def infer_files(paths, sample_size=None, min_confidence=0.99, out_dir=None, max_workers=None):
+    """
+    infer_files suggests qualifiers for many survey files
+    across a pool of processes.
+    
+    :param paths: list of strings representing paths to files
+    :param sample_size: integer, number of values to sample
+    :param min_confidence: float, confidence below which every
+                           value is tested
+    :param out_dir: string, directory to save the qualified 
+                    surveys to as CSV, None to not save them
+    :param max_workers: integer, number of processes, defaults
+                        to the number of CPUs
+    :returns: dictionary of path to the results of infer_file,
+              and dictionary of path to error message for files
+              that could not be qualified
+    """
+    
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    
+    results, errors = {}, {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(infer_file, path, sample_size, min_confidence, out_dir): path
+                   for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except Exception as error:
+                errors[path] = repr(error)
+    
+    return results, errors
 
    
 def add_qualifiers(df, dic):
@@ -332,33 +568,100 @@ def determine_type(col):
     most appropriate type of the column (float or string).
     
     :param col: data frame column
+    :returns: converted column and its type ('float' or 'str')
     """
     
     for typ in ['float', 'str']:
         try:
             copy = col.copy()
+            if pd.api.types.is_string_dtype(copy):
+                # Strings columns of pandas 3 cannot hold floats
+                copy = copy.astype(object)
             
             # Checks if values of column are strings of
             # numbers with commas (e.g. '1,629')
-            check_num = pd.Series(copy.dropna().unique()).apply(valid_num)
-            if check_num.all():
+            unique_vals = pd.Series(copy.dropna().unique())
+            if all_match(unique_vals, all_valid_num):
                 copy = copy.str.replace(',', '')
             
             # Attempts to convert column type to typ
             converted = copy.dropna().astype(typ)
             copy.loc[converted.index] = converted.values
-
-            if typ == 'float':
-                quant_cols.append(col.name)
-            elif typ == 'str':
-                text_cols.append(col.name)
                 
-            return copy
+            return copy, typ
         
         except ValueError:
             pass
 
 
+def determine_types_chunked(chunks):
+    """
+    Helper for streaming surveys (see panel_libs.SurveyChunks)
+    
+    determine_types_chunked finds which columns determine_type
+    would consider numerical when given the whole column, reading
+    the survey one chunk at a time.
+    
+    Chunks should be read as strings (SurveyChunks(path, dtype=str)),
+    since a column's dtype is otherwise inferred separately per chunk.
+    
+    :param chunks: iterable of data frames with the same columns
+    :returns: lists of numerical and string column names
+    
+    :Example:
+    >>> chunks = [pd.DataFrame({'a': ['1,629', '3'], 'b': ['1.5', 'x']}),
+    ...           pd.DataFrame({'a': ['12', None], 'b': ['2', '3']})]
+    >>> determine_types_chunked(chunks)
+    (['a'], ['b'])
+    """
+    
+    # Per column: whether every value is a number with commas, and
+    # whether the values convert to float as is/with commas removed
+    valid_nums, raw_float, stripped_float = {}, {}, {}
+    columns = []
+    
+    for chunk in chunks:
+        if not columns:
+            columns = list(chunk.columns)
+            for name in columns:
+                valid_nums[name] = raw_float[name] = stripped_float[name] = True
+            
+        for name in columns:
+            # Column is already known to be a string column
+            if not (raw_float[name] or (valid_nums[name] and stripped_float[name])):
+                continue
+            
+            values = chunk[name].dropna()
+            if valid_nums[name]:
+                valid_nums[name] = all_match(pd.Series(values.unique()), all_valid_num)
+                if valid_nums[name] and stripped_float[name]:
+                    stripped_float[name] = converts_to_float(values.astype(str).str.replace(',', ''))
+            if raw_float[name]:
+                raw_float[name] = converts_to_float(values)
+    
+    num_cols, str_cols = [], []
+    for name in columns:
+        is_float = stripped_float[name] if valid_nums[name] else raw_float[name]
+        (num_cols if is_float else str_cols).append(name)
+    
+    return num_cols, str_cols
+
+
+def converts_to_float(values):
+    """
+    Helper function for determine_types_chunked
+    
+    :param values: Series
+    :returns: bool whether all values can be converted to float
+    """
+    
+    try:
+        values.astype(float)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
 def valid_num(string):
     """
     Helper function for determine_type
@@ -402,17 +705,149 @@ def valid_num(string):
     return True
 
 
-def find_cols(df, cols, col_func=None):
+def all_match(values, test):
+    """
+    Helper function for determine_type and find_cols
+    
+    all_match applies a vectorized test to growing blocks of
+    values, stopping at the first block that has a value
+    failing the test.
+    
+    :param values: Series
+    :param test: function of a Series returning whether every
+                 value satisfies it
+    :returns: bool whether every value satisfies test
+    """
+    
+    values = values.reset_index(drop=True)
+    start, size = 0, 64
+    while start < len(values):
+        if not test(values.iloc[start:start+size]):
+            return False
+        start += size
+        size *= 4
+    return True
+
+
+# Equivalent of valid_num: digits, or thousands separated by commas,
+# optionally followed by decimals. Before the decimals, periods are
+# treated as thousands separators too (valid_num joins them with commas).
+num_regex = r'(?:\d+|\d{1,3}(?:[.,]\d{3})+)(?:\.[^.]*)?'
+
+def all_valid_num(values):
+    """
+    Vectorized valid_num
+    
+    :param values: Series
+    :returns: bool whether every value is a valid number string
+    """
+    
+    if pd.api.types.infer_dtype(values, skipna=False) != 'string':
+        return False
+    return bool(values.str.fullmatch(num_regex).all())
+
+
+def all_link(values):
+    """
+    Vectorized has_link
+    
+    :param values: Series of strings
+    :returns: bool whether every value is a link
+    """
+    
+    # Same expression as has_link, without capturing groups
+    link_regex = (r'^(?:http:\/\/www\.|https:\/\/www\.|http:\/\/|https:\/\/)'+
+                  r'?[a-z0-9]+(?:[\-\.]{1}[a-z0-9]+)*\.[a-z]{2,5}(?::[0-9]{1,5})?(?:\/.*)?$')
+    
+    return bool(values.str.contains(link_regex, regex=True).all())
+
+
+# Formats probed by all_date before falling back to dateutil
+date_formats = ['%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%Y/%m/%d', '%Y-%m-%d', 
+                '%m-%d-%Y', '%d-%m-%Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', 
+                '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%H:%M', '%H:%M:%S']
+
+def all_date(values):
+    """
+    Vectorized has_date
+    
+    Formats that parse part of a sample of the values are applied 
+    to all values with pd.to_datetime. Values matching none of them
+    are parsed one by one with dateutil, stopping at the first failure.
+    
+    :param values: Series of strings
+    :returns: bool whether every value is a date
+    """
+    
+    # Checks whether strings have date indicators
+    if not values.str.contains('[-/:]', regex=True).all():
+        return False
+    
+    remaining = values
+    for fmt in date_formats:
+        if len(remaining) == 0:
+            break
+        if pd.to_datetime(remaining.iloc[:50], format=fmt, errors='coerce').notna().any():
+            remaining = remaining[pd.to_datetime(remaining, format=fmt, errors='coerce').isna()]
+    
+    for value in remaining:
+        if not has_date(value):
+            return False
+    return True
+
+
+def all_long(values):
+    """
+    Vectorized has_long
+    
+    :param values: Series of strings
+    :returns: bool whether every value is a long
+    """
+    
+    return bool((values.str.len() > 100).all())
+
+
+def find_cols(df, cols, col_func=None, sample_size=None, min_confidence=0.99, scores=None,
+              quant_cols=()):
     """
     Helper function for generate_qualifiers
     
     find_cols finds the columns in a data frame
     that satisfy the requirements of a column function.
     
+    When sample_size is given, col_func is first tested on a 
+    stratified sample of each column's unique values (see
+    sample_values). A failing value settles the column. If every
+    sampled value passes, the column's confidence score is a lower
+    bound on the share of its values that pass too (see
+    sample_confidence), and all values are only tested when it is
+    below min_confidence: columns of one shape are settled by
+    their sample, columns mixing shapes or with rare shapes are
+    tested in full.
+    
     :param df: data frame
     :param cols: list of column names of df
     :param col_func: function
+    :param sample_size: integer, number of values to sample
+    :param min_confidence: float, confidence below which every
+                           value is tested
+    :param scores: dictionary receiving the confidence score of
+                   each column found
+    :param quant_cols: list of numerical column names, used when
+                       col_func is null
     :returns: list of column names whos elements satisfy col_func
+    
+    :Example:
+    >>> dates = pd.Series(pd.date_range('2000-01-01', periods=5000).strftime('%m/%d/%Y'))
+    >>> mixed = dates.where(dates.index % 3 > 0, dates.str.replace('/', '-'))
+    >>> scores = {}
+    >>> find_cols(pd.DataFrame({'clean': dates, 'mixed': mixed}), ['clean', 'mixed'],
+    ...           has_date, sample_size=500, scores=scores)
+    ['clean', 'mixed']
+    >>> bool(0.99 <= scores['clean'] < 1)
+    True
+    >>> scores['mixed']
+    1.0
     """
     
     found = []
@@ -443,17 +878,151 @@ def find_cols(df, cols, col_func=None):
             
             if num_unique > 200:
                 found.append(col)
+                if scores is not None:
+                    scores[col] = 1.0
                 continue
         
         # Applies function to unique column values. If every
         # element satisfies the function, the column is stored
-        test = pd.Series(df[col].dropna().unique()).apply(col_func)
-        if test.all():
+        unique_vals = pd.Series(df[col].dropna().unique())
+        score = 1.0
+        if (sample_size is None) or (len(unique_vals) <= sample_size):
+            satisfied = satisfies(unique_vals, col_func)
+        else:
+            sample = sample_values(unique_vals, sample_size)
+            satisfied = satisfies(sample, col_func)
+            if satisfied:
+                score = sample_confidence(unique_vals, sample, sample_size)
+                if score < min_confidence:
+                    satisfied = satisfies(unique_vals, col_func)
+                    score = 1.0
+        if satisfied:
             found.append(col)
+            if scores is not None:
+                scores[col] = score
                          
     return found
         
         
+def satisfies(values, col_func):
+    """
+    Helper function for find_cols
+    
+    :param values: Series
+    :param col_func: function
+    :returns: bool whether every value satisfies col_func
+    """
+    
+    if col_func in vectorized:
+        return all_match(values, vectorized[col_func])
+    return bool(values.apply(col_func).all())
+
+
+def sample_values(values, sample_size):
+    """
+    Helper function for find_cols
+    
+    sample_values draws a sample of values stratified by their
+    shape (see value_shapes). Shapes are taken from a pool of
+    values spread evenly across the column (see sample_pool).
+    Every shape gets at least one value (as long as the sample
+    size allows) and the rest of the sample is split in proportion
+    to their frequency.
+    
+    :param values: Series
+    :param sample_size: integer, number of values to sample
+    :returns: Series of sampled values
+    """
+    
+    if len(values) <= sample_size:
+        return values
+    
+    pool = sample_pool(values, sample_size)
+    shapes = value_shapes(pool)
+    
+    counts = shapes.value_counts()
+    quota = pd.Series(1, index=counts.index[:sample_size])
+    remaining = sample_size - len(quota)
+    if remaining > 0:
+        quota += np.floor(remaining * counts[quota.index] / counts[quota.index].sum()).astype(int)
+    
+    keep = pool.groupby(shapes).cumcount() < shapes.map(quota).fillna(0)
+    return pool[keep]
+
+
+def sample_pool(values, sample_size):
+    """
+    Helper function for sample_values and sample_confidence
+    
+    :param values: Series
+    :param sample_size: integer, number of values to sample
+    :returns: Series of up to 20 * sample_size values spread
+              evenly across values (all of them if there are
+              fewer)
+    """
+    
+    positions = np.unique(np.linspace(0, len(values) - 1, min(len(values), 20 * sample_size)).astype(int))
+    return values.iloc[positions].reset_index(drop=True)
+
+
+def value_shapes(values):
+    """
+    Helper function for sample_values and sample_confidence
+    
+    :param values: Series
+    :returns: Series of the shapes of values: runs of digits and
+              letters replaced by 9 and a (e.g. '09/14/1998' is 
+              '9/9/9')
+    """
+    
+    return (values.astype(str)
+            .str.replace('[0-9]+', '9', regex=True)
+            .str.replace('[a-zA-Z]+', 'a', regex=True))
+
+
+def sample_confidence(values, sample, sample_size, alpha=0.05):
+    """
+    Helper function for find_cols
+    
+    sample_confidence bounds from below the share of values that
+    satisfy a function, given that every value of a sample from
+    sample_values does. Each shape of the pool is a stratum: with 
+    k sampled values and no failure, its share of passing values
+    is at least alpha**(1/k) with confidence 1 - alpha (exact
+    binomial bound), or known when all its values were sampled.
+    Shapes of the pool without sampled values count as failing, 
+    and when the pool is not the whole column, shapes it missed
+    are estimated from the shapes seen once in it (Good-Turing).
+    
+    Columns of a single, well sampled shape therefore score high,
+    while columns spread over many shapes or with rare shapes
+    score low.
+    
+    :param values: Series of the unique values of the column
+    :param sample: Series of the sampled values
+    :param sample_size: integer, sample size given to sample_values
+    :param alpha: float, probability that the bound is wrong
+    :returns: float between 0 and 1
+    """
+    
+    pool = sample_pool(values, sample_size)
+    pool_counts = value_shapes(pool).value_counts()
+    sampled = value_shapes(sample).value_counts()
+    whole = len(pool) == len(values)
+    
+    passing = 0.0
+    for shape, count in pool_counts.items():
+        k = sampled.get(shape, 0)
+        if k == 0:
+            continue
+        passing += count if (whole and k >= count) else count * alpha ** (1 / k)
+    bound = passing / len(pool)
+    
+    if not whole:
+        bound -= (pool_counts == 1).sum() / len(pool)
+    return max(bound, 0.0)
+
+
 def has_link(string):
     """
     Function passed into find_cols
@@ -528,14 +1097,5 @@ def has_long(string):
     return str_len > 100
 
 
-def refresh():
-    """
-    refresh clears column names in num_cols
-    and text_cols and stores them if needed
-    for future use.
-    """
-    global quant_cols
-    quant_cols=[]
-    
-    global text_cols
-    text_cols=[]
+# Vectorized versions of the functions passed into find_cols
+vectorized = {has_link: all_link, has_date: all_date, has_long: all_long}
@@ -1,10 +1,13 @@
 # Importing libraries
 from PIL import Image, ImageDraw, ImageFont
+from concurrent.futures import ProcessPoolExecutor
+import io
 import os
-import re
-import pandas as pd
 import shutil
-import glob
+import tempfile
+import time
+import zipfile
+import pandas as pd
 import panel as pn
 
 # Importing required scripts
@@ -36,24 +39,32 @@ def image_display(df, cols, url):
     global progress_img
     progress_img = pn.pane.Markdown('')
     
+    # Data frame display, reused across updates
+    viewer = panellibs.DataViewer()
+    
     @pn.depends(generator.param.value)
     def generate_trigger(click):
         
         global run
         
         if (generator.value == False) and (not run):
-            display = pn.Row(panellibs.slider(ql.updated_df), margin=(20,0,0,-220))
+            display = pn.Row(panellibs.slider(ql.updated_df, viewer), margin=(20,0,0,-220))
             return display
         
         if run and not click:
+            def report_progress(text):
+                progress_img.object = base_progress + '\n| ' + text + ' | Image Generated |'
+            
             global image_df
-            image_df = generate_images(df, col_selector.value)
+            job_dir = new_job()
+            image_df = generate_images(df, col_selector.value, job_dir, report_progress)
             
             progress_img.object = ''
+            zip_url = url + '/' + job_dir.replace(os.sep, '/') + '/generated_images.zip'
             message = pn.pane.HTML("<p>Done. Zip archive with images " +
-                                   "ready to download <a href='" + url + "/generated_images.zip'" + 
+                                   "ready to download <a href='" + zip_url + "'" + 
                                    " target='_blank'>here</a>.</p>")
-            display = pn.Row(panellibs.slider(ql.updated_df), margin=(20,0,0,-220))
+            display = pn.Row(panellibs.slider(ql.updated_df, viewer), margin=(20,0,0,-220))
             
             return pn.Column(message, display)
             
@@ -72,79 +83,209 @@ def image_display(df, cols, url):
     
     return widgets
 
+# Font of the generated images
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images', 'arial.ttf')
+
+# Directory holding a directory per image generation job
+# (relative to the notebook, so that archives can be downloaded)
+JOBS_DIR = 'generated_images'
+
+# Jobs are removed once their archive is older than JOB_MAX_AGE
+# seconds, or when more than JOB_MAX_COUNT jobs are kept (see prune_jobs)
+JOB_MAX_AGE = 24 * 60 * 60
+JOB_MAX_COUNT = 20
+
 # Base progress menu for image generation
 base_progress = ('| Value | Status |' + 
                  '\n|:---------:|:-------:|')
 
 
-def generate_images(nonimage_df, col):
+# Styles of the generated images (background color, text color,
+# file name suffix) by value of the field_or_processed column
+image_styles = {'Processed Data': ('orange', 'blue', '_p'),
+                'Field Data': ('green', 'yellow', '_f')}
+default_style = ('white', 'blue', '_o')
+
+
+def generate_images(nonimage_df, col, job_dir=None, progress=None, max_workers=None, batch_size=500):
+    """
+    generate_images renders the values of a column as PNG
+    images and writes them into a generated_images.zip archive
+    in the job's directory. Each distinct image is rendered 
+    once, across a pool of processes.
+    
+    No other files are written and the working directory is
+    left unchanged, so several jobs can run at the same time
+    as long as they use different job directories.
     
-    nonimage_df.to_csv('images/string_image_df.csv')
+    :param nonimage_df: data frame
+    :param col: string, column whose values are rendered
+    :param job_dir: string representing path to the job's
+                    directory, defaults to a new one (see new_job)
+    :param progress: function called with the latest rendered value
+    :param max_workers: integer, number of processes, defaults
+                        to the number of CPUs
+    :param batch_size: integer, number of images per task
+    :returns: data frame with image names in the #img column
+    """
+    
+    if job_dir is None:
+        job_dir = new_job()
     
-    input_file = 'string_image_df.csv'
-    outcsv = input_file[0:-4] + '_img.csv'
     column_to_convert = col
-
-    if os.path.isdir("images"):
-        os.chdir("images")
-    else:
-        os.mkdir("images")
-        os.chdir("images")
+    df = nonimage_df.fillna('')
     
-    if 'Unnamed: 0' in nonimage_df.columns:
-        df = pd.read_csv(input_file, encoding = "utf-8").drop('Unnamed: 0', axis=1)
+    # Names each image after its value and style
+    texts = df[column_to_convert].astype(str)
+    if 'field_or_processed' in df.columns:
+        styles = [image_styles.get(value, default_style) for value in df['field_or_processed']]
     else:
-        df = pd.read_csv(input_file, encoding = "utf-8")
-
-    df.fillna('', inplace=True)
-    df["#img"] = ''
-
-    for index, row in df.iterrows():
-        if row[column_to_convert] == '':
-            row["#img"] = "image_not_available"
-            progress_img.object = base_progress + '\n| ' + row[column_to_convert] + ' | Image Not Available |'
-        elif 'field_or_processed' not in row.index:
-            fname = to_image(row[column_to_convert],"white","blue","_o")
-            row["#img"] = fname
-        else:
-        
-#         additional conditions:
-            if row['field_or_processed'] == "Processed Data":
-                fname = to_image(row[column_to_convert],"orange","blue","_p")
-            elif row['field_or_processed'] == "Field Data":
-                fname = to_image(row[column_to_convert],"green","yellow","_f")
-            else:
-                fname = to_image(row[column_to_convert],"white","blue","_o")
-            row["#img"] = fname
-
-    # Moves arial.ttf to working directory
-    os.chdir("..")
-    os.rename("images/arial.ttf", "arial.ttf")
-    os.remove("images/string_image_df.csv")
-
-    # Zips and removes files
-    shutil.make_archive('generated_images', 'zip', 'images')
-
-    files = glob.glob('images/*')
-    for f in files:
-        os.remove(f)
-
-    # Moves arial.ttf back to images folder
-    os.rename("arial.ttf", "images/arial.ttf")
+        styles = [default_style] * len(df)
+    names = image_names(texts) + [style[2] for style in styles]
+    df["#img"] = names.where(texts != '', "image_not_available")
+    
+    # Values sharing an image name are rendered once
+    images = (pd.DataFrame({'name': names, 'text': texts, 'style': styles})[texts != '']
+              .drop_duplicates('name', keep='last'))
+    
+    # Writes images into the archive as they are rendered. The 
+    # archive only appears under its name once complete.
+    rendered = render_images(images['text'].tolist(), images['style'].tolist(), 
+                             FONT_PATH, max_workers, batch_size)
+    zip_path = os.path.join(job_dir, 'generated_images.zip')
+    with zipfile.ZipFile(zip_path + '.partial', 'w', zipfile.ZIP_STORED) as archive:
+        for i, (name, text, png) in enumerate(zip(images['name'], images['text'], rendered)):
+            archive.writestr(name + '.png', png)
+            if (progress is not None) and ((i % batch_size == 0) or (i == len(images) - 1)):
+                progress(text)
+    os.replace(zip_path + '.partial', zip_path)
     
     return df
 
 
-def to_image(unicode_text, bgr_color, text_color,colortype):
+def new_job():
+    """
+    Helper function for generate_images
+    
+    :returns: string representing path to a new, empty
+              directory under JOBS_DIR
+    """
+    
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    prune_jobs()
+    return os.path.relpath(tempfile.mkdtemp(prefix='job_', dir=JOBS_DIR))
+
+
+def prune_jobs(max_age=None, max_count=None):
+    """
+    Helper function for new_job
+    
+    prune_jobs removes the job directories whose files were 
+    last written more than max_age seconds ago, then the oldest
+    ones until at most max_count are left. Running jobs keep
+    writing their archive, so they are the most recent.
+    
+    :param max_age: int, maximum age of a job in seconds
+    :param max_count: int, maximum number of jobs
+    """
+    
+    max_age = JOB_MAX_AGE if max_age is None else max_age
+    max_count = JOB_MAX_COUNT if max_count is None else max_count
+    
+    jobs = []
+    for name in os.listdir(JOBS_DIR):
+        job_dir = os.path.join(JOBS_DIR, name)
+        if not (name.startswith('job_') and os.path.isdir(job_dir)):
+            continue
+        try:
+            written = max([os.path.getmtime(job_dir)] + 
+                          [os.path.getmtime(os.path.join(job_dir, f)) for f in os.listdir(job_dir)])
+        except FileNotFoundError:
+            continue
+        jobs.append((written, job_dir))
+    
+    now = time.time()
+    jobs.sort(reverse=True)
+    for i, (written, job_dir) in enumerate(jobs):
+        if (now - written > max_age) or (i >= max_count):
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def image_names(texts):
+    """
+    Helper function for generate_images
+    
+    :param texts: Series of strings
+    :returns: Series of file names (without suffix) for texts
+    """
+    
+    return (texts.str.replace(r'[\\\\/*?:"<>|]', '', regex=True)
+            .str.replace(' ', '_', regex=False)
+            .str.replace('.', '_', regex=False))
+
+
+def render_images(texts, styles, font_path, max_workers=None, batch_size=500):
+    """
+    Helper function for generate_images
+    
+    render_images renders texts as PNG images in batches across
+    a pool of processes, each of which loads the font once. A
+    single batch is rendered in this process.
     
-    progress_img.object = base_progress + '\n| ' + unicode_text + ' | Image Generated |'
+    :param texts: list of strings
+    :param styles: list of (background color, text color, ...) tuples
+    :param font_path: string representing path to the font file
+    :param max_workers: integer, number of processes
+    :param batch_size: integer, number of images per task
+    :returns: iterator over the PNG bytes of each image, in order
+    """
     
-    filename = re.sub(r'[\\\\/*?:"<>|]',"",unicode_text)
-    filename = filename.replace(" ", "_")
-    filename = filename.replace(".", "_")
+    batches = [(texts[i:i+batch_size], styles[i:i+batch_size]) 
+               for i in range(0, len(texts), batch_size)]
     
-    font = ImageFont.truetype("arial.ttf", 28, encoding="unic")
-    text_width, text_height = font.getsize(unicode_text)
+    if len(batches) <= 1:
+        load_font(font_path)
+        for batch in batches:
+            yield from render_batch(batch)
+        return
+    
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=load_font, 
+                             initargs=(font_path,)) as executor:
+        for pngs in executor.map(render_batch, batches):
+            yield from pngs
+
+
+# Font of the current (worker) process, see load_font
+font = None
+
+def load_font(font_path):
+    global font
+    font = ImageFont.truetype(font_path, 28, encoding="unic")
+
+
+def render_batch(batch):
+    """
+    Helper function for render_images
+    
+    :param batch: tuple of texts and styles
+    :returns: list of PNG bytes
+    """
+    
+    texts, styles = batch
+    return [to_image(text, style[0], style[1]) for text, style in zip(texts, styles)]
+
+
+def to_image(unicode_text, bgr_color, text_color):
+    """
+    Helper function for render_batch
+    
+    to_image draws text on a canvas with the font 
+    loaded by load_font.
+    
+    :returns: bytes of the PNG image
+    """
+    
+    text_width, text_height = text_size(unicode_text)
 
     if text_width *1.0 / text_height > 1.5:
         text_height = int(text_width/1.5)
@@ -158,6 +299,22 @@ def to_image(unicode_text, bgr_color, text_color,colortype):
     canvas = Image.new('RGB', (text_width + 10, text_height + 10), bgr_color)
     draw = ImageDraw.Draw(canvas)
     draw.text((text_x, text_y), unicode_text, text_color, font)
-    canvas.save(filename + colortype + ".png", "PNG")
     
-    return filename+colortype
+    png = io.BytesIO()
+    canvas.save(png, "PNG")
+    
+    return png.getvalue()
+
+
+def text_size(unicode_text):
+    """
+    Helper function for to_image
+    
+    :returns: width and height of text in the loaded font
+    """
+    
+    # FreeTypeFont.getsize was removed in Pillow 10
+    if hasattr(font, 'getsize'):
+        return font.getsize(unicode_text)
+    left, top, right, bottom = font.getbbox(unicode_text)
+    return right, bottom